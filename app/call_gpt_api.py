@@ -1,15 +1,187 @@
-from .config import Config
-from openai import OpenAI
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
 
-client = OpenAI(
-  api_key=Config.GPT_API_KEY
-)
+from .config import CallSettings, Config
+from .model_backends import create_backend
+from .model_scheduler import INTERACTIVE, DeadlineExceeded, ModelCallScheduler
+from .tracing import span
+from .word_knowledge import estimate_tokens
+from openai import APIConnectionError, APIError, InternalServerError, OpenAI, RateLimitError
+
+# Call sites, each with its own model settings in Config.CALL_SETTINGS
+REPLY = "reply"
+EVALUATION = "evaluation"
+EXPLANATION = "explanation"
+SUMMARY = "summary"
+
+# Failures worth another attempt; APITimeoutError is an APIConnectionError
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+# Everything acall_gpt_api and astream_gpt_api raise when a call fails for good
+MODEL_ERRORS = (APIError, DeadlineExceeded)
+DEFAULT_COMPLETION_TOKENS = 300  # expected completion size when a site sets no max_tokens
+
+# Created lazily, so importing the app needs no credentials and the async
+# backend binds to the event loop of the worker that serves requests
+_client: Optional[OpenAI] = None
+_backend = None
+_scheduler: Optional[ModelCallScheduler] = None
 
 def call_gpt_api(messages):
-    
-    response = client.chat.completions.create(
-        model="gpt-4o", 
-        temperature=0.1, 
+    """Blocking call on the OpenAI API with the reply settings, used by the legacy controllers"""
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=Config.GPT_API_KEY, base_url=Config.GPT_BASE_URL)
+    settings = Config.CALL_SETTINGS[REPLY]
+    response = _client.chat.completions.create(
+        model=settings.model,
+        temperature=settings.temperature,
         messages=messages
     )
     return response.choices[0].message.content
+
+def get_backend():
+    """The model backend selected by Config.MODEL_BACKEND"""
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+def get_scheduler() -> ModelCallScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ModelCallScheduler(
+            max_concurrency=Config.GPT_MAX_CONCURRENCY,
+            requests_per_minute=Config.GPT_REQUESTS_PER_MINUTE,
+            tokens_per_minute=Config.GPT_TOKENS_PER_MINUTE
+        )
+    return _scheduler
+
+def estimate_call_tokens(messages, settings: CallSettings) -> int:
+    """Prompt plus expected completion, for the tokens/min budget"""
+    prompt = sum(estimate_tokens(message["content"]) for message in messages)
+    return prompt + (settings.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After(-Ms) headers"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    if "retry-after-ms" in response.headers:
+        try:
+            return float(response.headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error: Exception, attempt: int, deadline: float) -> Optional[float]:
+    """
+    Seconds to wait before retrying after `attempt` failed attempts, or None to give up.
+    Exponential backoff with full jitter, never shorter than Retry-After; a
+    rate-limited call also pauses every other call for Retry-After seconds.
+    """
+    scheduler = get_scheduler()
+    hint = retry_after(error)
+    if isinstance(error, RateLimitError):
+        scheduler.counts["rate_limited"] += 1
+        if hint:
+            scheduler.pause(hint)
+    if attempt >= Config.GPT_MAX_RETRIES:
+        return None
+    delay = random.uniform(0, min(Config.GPT_RETRY_MAX_DELAY, Config.GPT_RETRY_BASE_DELAY * 2 ** attempt))
+    if hint:
+        delay = max(delay, hint)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+def attempt_timeout(timeout: Optional[float], settings: CallSettings, deadline: float) -> float:
+    return max(min(timeout if timeout is not None else settings.timeout, deadline - time.monotonic()), 0.001)
+
+async def acall_gpt_api(messages, call_site: str = REPLY, timeout: Optional[float] = None,
+                        json_output: bool = False, priority: int = INTERACTIVE):
+    """
+    Awaitable call_gpt_api: never blocks the event loop.
+    - call_site picks the model settings; timeout overrides the site's per-attempt timeout
+    - json_output asks the model for a single JSON object (the prompt must mention JSON)
+    - the call waits its turn in the scheduler by priority, and 429s, 5xx, timeouts and
+      connection errors are retried with backoff until the site's deadline
+    Raises one of MODEL_ERRORS when the call fails for good.
+    """
+    settings = Config.CALL_SETTINGS[call_site]
+    scheduler = get_scheduler()
+    deadline = time.monotonic() + settings.deadline
+    tokens = estimate_call_tokens(messages, settings)
+    for attempt in itertools.count():
+        with span("model_wait", call_site):
+            await scheduler.acquire(priority, tokens, deadline)
+        try:
+            with span("model_call", call_site):
+                return await get_backend().complete(
+                    messages, call_site, settings,
+                    timeout=attempt_timeout(timeout, settings, deadline), json_output=json_output
+                )
+        except RETRYABLE_ERRORS as error:
+            delay = retry_delay(error, attempt, deadline)
+            if delay is None:
+                scheduler.counts["failed"] += 1
+                raise
+        except APIError:
+            scheduler.counts["failed"] += 1
+            raise
+        finally:
+            scheduler.release()
+        scheduler.counts["retries"] += 1
+        await asyncio.sleep(delay)
+
+async def astream_gpt_api(messages, call_site: str = REPLY, timeout: Optional[float] = None,
+                          priority: int = INTERACTIVE) -> AsyncIterator[str]:
+    """Yield completion text deltas as the model produces them; retried like acall_gpt_api until the first delta"""
+    settings = Config.CALL_SETTINGS[call_site]
+    scheduler = get_scheduler()
+    deadline = time.monotonic() + settings.deadline
+    tokens = estimate_call_tokens(messages, settings)
+    for attempt in itertools.count():
+        with span("model_wait", call_site):
+            await scheduler.acquire(priority, tokens, deadline)
+        streamed = False
+        try:
+            with span("model_stream", call_site):
+                async for token in get_backend().stream(
+                    messages, call_site, settings, timeout=attempt_timeout(timeout, settings, deadline)
+                ):
+                    streamed = True
+                    yield token
+            return
+        except RETRYABLE_ERRORS as error:
+            delay = None if streamed else retry_delay(error, attempt, deadline)
+            if delay is None:
+                scheduler.counts["failed"] += 1
+                raise
+        except APIError:
+            scheduler.counts["failed"] += 1
+            raise
+        finally:
+            scheduler.release()
+        scheduler.counts["retries"] += 1
+        await asyncio.sleep(delay)
+
+async def close_backend():
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
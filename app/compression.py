@@ -0,0 +1,22 @@
+from typing import Collection
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    Starlette's GZipMiddleware, minus the paths in exclude_paths. Server-sent
+    event streams must be left out: the compressor holds small events back
+    until it has enough data, which would stall the stream.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, compresslevel: int = 6,
+                 exclude_paths: Collection[str] = ()):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
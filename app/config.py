@@ -1,8 +1,85 @@
 import os
+from typing import NamedTuple, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+class CallSettings(NamedTuple):
+    """Model parameters for one kind of model call"""
+    model: str
+    temperature: float
+    max_tokens: Optional[int]  # None leaves it to the model's default
+    timeout: float  # seconds per attempt
+    deadline: float  # seconds for the whole call, queueing and retries included
+
+def call_settings(site: str) -> CallSettings:
+    """Settings for a call site from <SITE>_MODEL, _TEMPERATURE, _MAX_TOKENS, _TIMEOUT and _DEADLINE, falling back to the GPT_* defaults"""
+    prefix = site.upper()
+    max_tokens = os.getenv(f'{prefix}_MAX_TOKENS')
+    return CallSettings(
+        model=os.getenv(f'{prefix}_MODEL', os.getenv('GPT_MODEL', 'gpt-4o')),
+        temperature=float(os.getenv(f'{prefix}_TEMPERATURE', os.getenv('GPT_TEMPERATURE', '0.1'))),
+        max_tokens=int(max_tokens) if max_tokens else None,
+        timeout=float(os.getenv(f'{prefix}_TIMEOUT', os.getenv('GPT_TIMEOUT', '60'))),
+        deadline=float(os.getenv(f'{prefix}_DEADLINE', os.getenv('GPT_DEADLINE', '120')))
+    )
+
 class Config:
     GPT_API_KEY = os.getenv('GPT_API_KEY')
-    
+    GPT_BASE_URL = os.getenv('GPT_BASE_URL')  # None means api.openai.com
+    GPT_MAX_CONCURRENCY = int(os.getenv('GPT_MAX_CONCURRENCY', '32'))  # in-flight calls per worker
+    GPT_MAX_CONNECTIONS = int(os.getenv('GPT_MAX_CONNECTIONS', '64'))  # pooled HTTP connections
+    GPT_REQUESTS_PER_MINUTE = float(os.getenv('GPT_REQUESTS_PER_MINUTE', '0'))  # per worker, 0 = unlimited
+    GPT_TOKENS_PER_MINUTE = float(os.getenv('GPT_TOKENS_PER_MINUTE', '0'))  # estimated, per worker, 0 = unlimited
+    GPT_MAX_RETRIES = int(os.getenv('GPT_MAX_RETRIES', '4'))  # on 429, 5xx, timeouts and connection errors
+    GPT_RETRY_BASE_DELAY = float(os.getenv('GPT_RETRY_BASE_DELAY', '0.5'))  # seconds, doubled per attempt
+    GPT_RETRY_MAX_DELAY = float(os.getenv('GPT_RETRY_MAX_DELAY', '20'))
+    GPT_STREAM_USAGE = os.getenv('GPT_STREAM_USAGE', 'true').lower() == 'true'  # ask openai_compatible servers for stream usage
+    MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'openai')  # 'openai', 'openai_compatible' (at GPT_BASE_URL) or 'stub'
+    # Per call site: reply (conversation), evaluation (word observations), explanation (/assist/), summary
+    CALL_SETTINGS = {site: call_settings(site) for site in ('reply', 'evaluation', 'explanation', 'summary')}
+    STUB_LATENCY = float(os.getenv('STUB_LATENCY', '0'))  # seconds per stub completion
+    STUB_JITTER = float(os.getenv('STUB_JITTER', '0'))  # extra random seconds, up to this much
+    STUB_SEED = int(os.getenv('STUB_SEED', '0'))
+    STUB_RESPONSES_PATH = os.getenv('STUB_RESPONSES_PATH')  # JSON file of scripted responses per call site
+    USER_DATA_DIR = os.getenv('USER_DATA_DIR', 'user_data')
+    USER_STORE = os.getenv('USER_STORE', 'sqlite')  # 'sqlite' or 'json'
+    USER_DB_PATH = os.getenv('USER_DB_PATH', os.path.join(USER_DATA_DIR, 'users.sqlite3'))
+    USER_CACHE_ENABLED = os.getenv('USER_CACHE_ENABLED', 'true').lower() == 'true'
+    USER_CACHE_MAX_USERS = int(os.getenv('USER_CACHE_MAX_USERS', '1000'))
+    USER_CACHE_MAX_BYTES = int(os.getenv('USER_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+    USER_CACHE_IDLE_SECONDS = float(os.getenv('USER_CACHE_IDLE_SECONDS', '900'))
+    USER_CACHE_FLUSH_INTERVAL = float(os.getenv('USER_CACHE_FLUSH_INTERVAL', '2'))  # seconds between write-behind flushes
+    HISTORY_RECENT_LINES = int(os.getenv('HISTORY_RECENT_LINES', '6'))  # conversation lines quoted verbatim in prompts
+    HISTORY_MAX_LINES = int(os.getenv('HISTORY_MAX_LINES', '40'))  # older lines get summarized past this
+    WORD_KNOWLEDGE_TOP_K = int(os.getenv('WORD_KNOWLEDGE_TOP_K', '30'))  # words described in each conversation prompt
+    WORD_KNOWLEDGE_MAX_TOKENS = int(os.getenv('WORD_KNOWLEDGE_MAX_TOKENS', '600'))
+    WORDS_PER_TURN = int(os.getenv('WORDS_PER_TURN', '8'))  # due reviews, then new words, put in each conversation prompt
+    NEW_WORDS_PER_TURN = int(os.getenv('NEW_WORDS_PER_TURN', '5'))  # at most, and only while few reviews are due
+    # Grade /converse/ turns in a background queue instead of making the learner wait for it
+    EVALUATION_IN_BACKGROUND = os.getenv('EVALUATION_IN_BACKGROUND', 'true').lower() == 'true'
+    EVALUATION_QUEUE_PATH = os.getenv('EVALUATION_QUEUE_PATH', os.path.join(USER_DATA_DIR, 'evaluation_queue.sqlite3'))
+    EVALUATION_QUEUE_WORKERS = int(os.getenv('EVALUATION_QUEUE_WORKERS', '8'))
+    EVALUATION_QUEUE_MAX_ATTEMPTS = int(os.getenv('EVALUATION_QUEUE_MAX_ATTEMPTS', '5'))
+    EVALUATION_QUEUE_RETRY_DELAY = float(os.getenv('EVALUATION_QUEUE_RETRY_DELAY', '5'))  # seconds, doubled per attempt
+    GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', '1024'))  # compress responses this large for clients that accept gzip
+    SESSION_MAX_PER_WORKER = int(os.getenv('SESSION_MAX_PER_WORKER', '500'))  # open WebSocket sessions
+    SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', '600'))  # close a session after this long without a message
+    SESSION_CHECKPOINT_TURNS = int(os.getenv('SESSION_CHECKPOINT_TURNS', '10'))  # write the user to the store every n turns, 0 = only when the session ends
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'  # phase spans and /metrics histograms
+    TRACE_SLOW_REQUEST_SECONDS = float(os.getenv('TRACE_SLOW_REQUEST_SECONDS', '5'))  # log a phase breakdown past this
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'  # sample the event loop, see /debug/profile
+    PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.01'))  # seconds between samples
+    EXPLANATION_CACHE_ENABLED = os.getenv('EXPLANATION_CACHE_ENABLED', 'true').lower() == 'true'
+    EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv('EXPLANATION_CACHE_MAX_ENTRIES', '10000'))
+    EXPLANATION_CACHE_TTL = float(os.getenv('EXPLANATION_CACHE_TTL', str(7 * 24 * 3600)))  # seconds
+    EXPLANATION_CACHE_PATH = os.getenv('EXPLANATION_CACHE_PATH')  # SQLite file shared by workers; unset = in-process only
+    BATCH_EVALUATION_MAX_TOKENS = int(os.getenv('BATCH_EVALUATION_MAX_TOKENS', '1500'))  # estimated message tokens per model call
+    BATCH_EVALUATION_MAX_MESSAGES = int(os.getenv('BATCH_EVALUATION_MAX_MESSAGES', '25'))  # messages per model call
+    BATCH_EVALUATION_CONCURRENCY = int(os.getenv('BATCH_EVALUATION_CONCURRENCY', '4'))  # model calls in flight per batch
+    BATCH_EVALUATION_MAX_REQUEST = int(os.getenv('BATCH_EVALUATION_MAX_REQUEST', '1000'))  # messages per request
+    # Production server (python -m app.server): worker processes forked from one preloaded app
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', '8000'))
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', str(os.cpu_count() or 1)))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))  # seconds in-flight requests get on shutdown
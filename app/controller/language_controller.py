@@ -1,12 +1,39 @@
-from typing import List, Dict, Optional, Tuple
-from fastapi import FastAPI, HTTPException
+from typing import Any, AsyncIterator, Awaitable, List, Dict, NamedTuple, Optional, Set, Tuple
+import asyncio
+import hashlib
+from collections import Counter
+import itertools
+import logging
+import os
+from contextlib import aclosing
+from fastapi import FastAPI, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import json
+from functools import lru_cache
 from pathlib import Path
-from datetime import datetime
-from ..call_gpt_api import call_gpt_api
-from ..data.data_processing import get_data_list
+from ..call_gpt_api import (
+    EVALUATION, EXPLANATION, MODEL_ERRORS, REPLY, SUMMARY,
+    acall_gpt_api, astream_gpt_api, close_backend, get_scheduler
+)
+from ..compression import SelectiveGZipMiddleware
+from ..config import Config
+from ..data.data_processing import CandidateMatcher, get_vocabulary
+from ..evaluation_parser import PARSE_STATS, ParsedEvaluation, parse_batch_evaluation, parse_evaluation
+from ..job_queue import STOP_TIMEOUT, UserJobQueue
+from ..model_backends import TOKEN_USAGE
+from ..model_scheduler import BACKGROUND, BATCH
+from .. import tracing
+from ..models import UserProgress, WordHistory
+from ..profiler import SamplingProfiler
+from ..response_cache import ResponseCache, normalize_query
+from ..review_scheduler import now_seconds
+from ..storage import UserStorage
+from ..tracing import TracingMiddleware, register_collector, render_metrics, span
+from ..word_knowledge import estimate_tokens, select_word_knowledge
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -17,276 +44,894 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-class WordHistory(BaseModel):
-    observations: List[Dict[str, str]] = []  # List of {timestamp, comment} dicts
-    last_used: Optional[str] = None
-
-class UserProgress(BaseModel):
-    word_history: Dict[str, WordHistory] = {}  # word: WordHistory
-    role_play: Optional[str] = None
-    current_position: int = 0
-    conversation_history: List[str] = []
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=Config.GZIP_MIN_BYTES, exclude_paths={"/converse/stream/"})
+app.add_middleware(TracingMiddleware)
+tracing.enabled = Config.TRACING_ENABLED
+tracing.slow_request_seconds = Config.TRACE_SLOW_REQUEST_SECONDS
+PROFILER = SamplingProfiler(Config.PROFILER_INTERVAL) if Config.PROFILER_ENABLED else None
+# For the health endpoints: ready once startup has run, draining from the
+# shutdown signal on (the prefork server calls begin_drain() as it arrives)
+WORKER_STATE = {"ready": False, "draining": False}
+
+@app.on_event("startup")
+async def startup():
+    if PROFILER is not None:
+        # Startup runs on the event loop's thread, which is the one worth sampling
+        PROFILER.start()
+    # Evaluations left pending by the last run
+    EVALUATION_QUEUE.start()
+    WORKER_STATE["ready"] = True
+
+@app.on_event("shutdown")
+async def shutdown():
+    begin_drain()
+    try:
+        for task in list(BACKGROUND_TASKS):
+            task.cancel()
+        if BACKGROUND_TASKS:
+            await asyncio.wait(list(BACKGROUND_TASKS), timeout=STOP_TIMEOUT)
+        await EVALUATION_QUEUE.stop()
+    finally:
+        # Pending user writes are flushed even if background work failed to stop
+        await UserStorage.close()
+        await close_backend()
+        if PROFILER is not None:
+            PROFILER.stop()
 
 class ConversationInput(BaseModel):
     username: str
     user_message: str
     role_play: Optional[str] = None
+    since_version: Optional[int] = None  # word_history version the client has; only changes are returned
 
 class ConversationResponse(BaseModel):
     response: str
+    # With delta=true only the words observed since the client's version, each
+    # with its current digest and just the new observations to append
     word_history: Dict[str, WordHistory]
     next_words_to_learn: List[str]
+    review_words: List[str] = []  # words the scheduler had due for review this turn
     current_position: int
+    version: int = 0
+    delta: bool = False
 
 class QueryInput(BaseModel):
     query: str
     username: str
+    no_cache: bool = False  # skip the explanation cache and ask the model again
+    since_version: Optional[int] = None
 
-DATA_DIR = Path("user_data")
-DATA_DIR.mkdir(exist_ok=True)
-FREQUENCY_LIST = get_data_list()
-
-def add_observation(history: WordHistory, comment: str) -> WordHistory:
-    """Add a new observation to word history"""
-    history.observations.append({
-        "timestamp": datetime.now().isoformat(),
-        "comment": comment
-    })
-    history.last_used = datetime.now().isoformat()
-    return history
-
-
-class UserStorage:
-    @staticmethod
-    def get_user_file_path(username: str) -> Path:
-        return DATA_DIR / f"{username}.json"
-
-    @staticmethod
-    def save_user_data(username: str, progress: UserProgress):
-        file_path = UserStorage.get_user_file_path(username)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(progress.dict(), f, ensure_ascii=False, indent=2)
-
-    @staticmethod
-    def load_user_data(username: str) -> UserProgress:
-        file_path = UserStorage.get_user_file_path(username)
-        if not file_path.exists():
-            return UserProgress()
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return UserProgress(**data)
+class BatchEvaluationInput(BaseModel):
+    username: str
+    messages: List[str] = Field(min_length=1, max_length=Config.BATCH_EVALUATION_MAX_REQUEST)
+
+VOCABULARY = get_vocabulary()
+CANDIDATE_MATCHER = CandidateMatcher(VOCABULARY)
+BACKGROUND_TASKS: Set[asyncio.Task] = set()
+SUMMARIES_IN_FLIGHT: Set[str] = set()
+OPEN_SESSIONS: Set[WebSocket] = set()
+SESSION_STATS: Counter = Counter()  # opened, rejected, timed_out, turns, checkpoints
+MAX_PROGRESS_PAGE = 1000
+EXPLANATION_CACHE = ResponseCache(
+    max_entries=Config.EXPLANATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=Config.EXPLANATION_CACHE_TTL,
+    disk_path=Path(Config.EXPLANATION_CACHE_PATH) if Config.EXPLANATION_CACHE_PATH else None
+) if Config.EXPLANATION_CACHE_ENABLED else None
+
+def begin_drain():
+    """Fail readiness checks from now on, so load balancers stop routing new requests here"""
+    WORKER_STATE["draining"] = True
+
+def preload():
+    """
+    Build what a worker would otherwise build on its first requests. The prefork
+    server calls it once before forking, so every worker starts with it and
+    shares its memory pages.
+    """
+    PromptTemplate.create_system_prompt()
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    app.openapi()
+
+def close_connections():
+    """Close the SQLite connections opened at import; the prefork server does this before forking"""
+    UserStorage.close_connections()
+    EVALUATION_QUEUE.close()
+    if EXPLANATION_CACHE is not None:
+        EXPLANATION_CACHE.close()
+
+def reopen_connections():
+    """Open a forked worker's own SQLite connections"""
+    UserStorage.reopen_connections()
+    EVALUATION_QUEUE.reopen()
+    if EXPLANATION_CACHE is not None:
+        EXPLANATION_CACHE.reopen()
+
+def word_history_update(progress: UserProgress, since_version: Optional[int]) -> Tuple[Dict[str, WordHistory], bool]:
+    """The word history to send and whether it is a delta: changes since the client's version when known, else all of it"""
+    if since_version is not None:
+        changes = progress.changes_since(since_version)
+        if changes is not None:
+            return changes, True
+    return progress.word_history, False
+
+def apply_evaluation(progress: UserProgress, evaluation: str):
+    """Record each evaluated vocabulary word as an observation"""
+    with span("parse_evaluation"):
+        parsed = parse_evaluation(evaluation, VOCABULARY)
+    if parsed.unparsed or parsed.unmatched:
+        logger.info("Evaluation kept %d observations, %d lines unparsed, %d words not in vocabulary",
+                    len(parsed.observations), parsed.unparsed, parsed.unmatched)
+
+    for word, comment in parsed.observations:
+        progress.add_observation(word, comment)
+
+async def call_concurrently(primary: Awaitable[str], evaluation: Optional[Awaitable[str]]) -> Tuple[str, str]:
+    """
+    Run the answer call and the evaluation call of a turn at the same time.
+    - If there is nothing to evaluate (evaluation is None), only the answer call runs
+    - If the answer call fails, the evaluation is cancelled and the request fails with 502
+    - If only the evaluation fails, the turn is answered without new observations
+    """
+    primary_task = asyncio.ensure_future(primary)
+    evaluation_task = asyncio.ensure_future(evaluation) if evaluation is not None else None
+    try:
+        answer = await primary_task
+    except MODEL_ERRORS as e:
+        if evaluation_task is not None:
+            evaluation_task.cancel()
+            await asyncio.gather(evaluation_task, return_exceptions=True)
+        raise HTTPException(status_code=502, detail="Language model request failed") from e
+    except BaseException:
+        if evaluation_task is not None:
+            evaluation_task.cancel()
+        raise
+
+    return answer, await await_evaluation(evaluation_task)
+
+async def await_evaluation(evaluation_task: Optional[Awaitable[str]]) -> str:
+    if evaluation_task is None:
+        return ""
+    try:
+        return await evaluation_task
+    except MODEL_ERRORS:
+        logger.warning("Evaluation call failed, skipping word observations", exc_info=True)
+        return ""
+
+def chunk_messages(messages: List[str], max_tokens: int, max_messages: int) -> List[List[int]]:
+    """
+    Group message indices, in order, into chunks of at most max_messages whose
+    estimated tokens stay within max_tokens. A message over the budget on its
+    own gets a chunk to itself. Blank messages are left out.
+    """
+    chunks: List[List[int]] = []
+    chunk: List[int] = []
+    chunk_tokens = 0
+    for index, message in enumerate(messages):
+        if not message.strip():
+            continue
+        tokens = estimate_tokens(message)
+        if chunk and (chunk_tokens + tokens > max_tokens or len(chunk) == max_messages):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(index)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+# Prompts are laid out for the provider's prompt-prefix cache: everything that
+# is the same across calls goes first, byte-identical and built once at import,
+# and the per-call parts follow, least volatile first.
+CONVERSATION_RULES = """You are a language learning buddy helping users learn Hebrew through natural conversation. You will:
+1. Match the user's level based on their word history and conversation history.
+2. Use well-understood words as a foundation and introduce the new words gradually.
+3. Match the roleplay context if provided.
+4. Keep responses concise and conversational (1-2 sentences).
+5. Work the words due for review into the conversation, especially ones the user asked about or used incorrectly.
+6. Avoid using English translations in parentheses.
+7. Ensure natural conversation flow.
+8. Talk as a friend, not a tutor.
+9. Focus on teaching the 1000 most common words, reinforcing them through context.
+10. SPEAK ONLY IN HEBREW.
+
+Each message gives you, in order: a summary of the earlier conversation, the user's
+knowledge of the words that matter for this turn (words in their message, then words
+due for review), the new words to introduce, the latest lines of the conversation and
+the user's new message. Use the user's knowledge and struggles to come up with
+conversation that matches their level."""
+
+EXAMPLE_COMMENTS = """Example comments:
+- "perfect usage in context"
+- "used word incorrectly, confused with [other word]"
+- "correct usage but wrong gender"
+- "asked about meaning, needs reinforcement\""""
+
+EVALUATION_INSTRUCTIONS = f"""You are a Hebrew language evaluator.
+For each Hebrew word the user used in their message, provide a ONE sentence observation about their usage.
+Focus on:
+- Correctness of usage
+- Understanding of meaning
+- Any confusion or errors
+- Grammatical accuracy
+
+Respond with a JSON object, writing each word exactly as the user wrote it:
+{{"observations": [{{"word": "WORD", "comment": "comment"}}]}}
+
+{EXAMPLE_COMMENTS}"""
+
+BATCH_EVALUATION_INSTRUCTIONS = f"""You are evaluating a batch of messages a Hebrew learner wrote, each prefixed with its number in brackets.
+For each message, and for each Hebrew word the learner used in it, provide a ONE sentence
+observation about their usage: correctness, understanding of meaning, confusion or errors,
+grammatical accuracy.
+
+Respond with a JSON object with one entry for every message, in order, writing each word
+exactly as the learner wrote it. Use an empty observations list for a message with no Hebrew words:
+{{"messages": [{{"index": 0, "observations": [{{"word": "WORD", "comment": "comment"}}]}}]}}
+
+{EXAMPLE_COMMENTS}"""
+
+IDENTIFICATION_INSTRUCTIONS = """You are evaluating a Hebrew learner's question.
+You are given candidate Hebrew words and the learner's question.
+For each relevant candidate word, provide a ONE sentence observation about what they're asking.
+
+Respond with a JSON object:
+{"observations": [{"word": "WORD", "comment": "observation"}]}
+
+Example observations:
+- "asked about basic meaning, does not know word"
+- "perfect usage, asked about gender"
+- "knows meaning, confused about usage context\""""
+
+EXPLANATION_INSTRUCTIONS = "You are a Hebrew language assistant. Provide clear, helpful explanations in English."
+
+SUMMARY_INSTRUCTIONS = """You summarize language practice conversations.
+Update the running summary of a Hebrew practice conversation with the new lines you are given.
+Keep it under 120 words, in English. Keep the topics discussed, facts the user shared about
+themselves, the current role-play situation and any recurring mistakes. Return only the summary."""
 
 class PromptTemplate:
     @staticmethod
-    def create_system_prompt() -> str:
-        return """You are a language learning buddy helping users learn Hebrew through natural conversation. You will:
-        1. Match the user's level based on their word history and conversation history.
-        2. Use well-understood words as a foundation and introduce new words gradually.
-        3. Match the roleplay context if provided.
-        4. Keep responses concise and conversational (1-2 sentences).
-        5. Reinforce words the user has recently asked about or used incorrectly.
-        6. Avoid using English translations in parentheses.
-        7. Ensure natural conversation flow.
-        8. Talk as a friend, not a tutor.
-        9. Focus on teaching the 1000 most common words, reinforcing them through context.
-        10. SPEAK ONLY IN HEBREW.
+    @lru_cache(maxsize=256)
+    def create_system_prompt(role_play: Optional[str] = None) -> str:
+        """
+        Rules, then the role-play persona: identical for every
+        turn of every user in the same role-play, so it is the cacheable prefix
         """
+        persona = (f"\n\nYou are {role_play} having a conversation. "
+                   "Maintain character but keep language appropriate to user's level.") if role_play else ""
+        return CONVERSATION_RULES + persona
 
     @staticmethod
     def create_conversation_prompt(
-        role_play: Optional[str],
         user_message: str,
         word_history: Dict[str, WordHistory],
         next_words: List[str],
-        conversation_history: List[str]
+        review_words: List[str],
+        conversation_history: List[str],
+        conversation_summary: str = ""
     ) -> str:
-        role_context = f"\nYou are {role_play} having a conversation. Maintain character but keep language appropriate to user's level." if role_play else ""
-        
-        history_str = "\n".join(conversation_history[-6:]) if conversation_history else "No previous conversation"
-
-        word_knowledge = []
-        for word, history in word_history.items():
-            if history.observations:
-                observations = [f"- {obs['timestamp']}: {obs['comment']}" 
-                              for obs in sorted(history.observations, 
-                                              key=lambda x: x['timestamp'])]
-                word_summary = f"{word}:\n" + "\n".join(observations)
-                word_knowledge.append(word_summary)
-        
-        return f"""Previous Conversation:
-        {history_str}
-        
-        User's Message: {user_message}
-        Conversation Context:{role_context}
-
-        User's Word Knowledge:
-        {chr(10).join(word_knowledge)}
-
-        Use the user's knowledge and struggles to come up with conversation that matches their level. 
-        Reinforce words they have recently asked about or used incorrectly.
-        Introduce new words gradually, focusing on the most common words.
-        SPEAK ONLY IN HEBREW.
         """
+        Word knowledge comes from each word's digest (status, error count, latest
+        comment), limited to the words in this message and the words due for review,
+        so the prompt stays the same size however long the user has studied.
+        Parts go from least to most volatile: the summary changes every few dozen
+        lines, the recent history and the message every turn.
+        """
+        history_str = "\n".join(conversation_history[-Config.HISTORY_RECENT_LINES:]) if conversation_history else "No previous conversation"
+
+        word_knowledge = select_word_knowledge(
+            word_history,
+            CANDIDATE_MATCHER.match(user_message),
+            review_words,
+            top_k=Config.WORD_KNOWLEDGE_TOP_K,
+            max_tokens=Config.WORD_KNOWLEDGE_MAX_TOKENS
+        )
+
+        return f"""Summary of earlier conversation: {conversation_summary or "None"}
+
+User's Word Knowledge:
+{chr(10).join(word_knowledge) or "None yet"}
+
+New Words to Introduce: {", ".join(next_words) or "None"}
+
+Previous Conversation:
+{history_str}
+
+User's Message: {user_message}"""
+
+    @staticmethod
+    def create_summary_prompt(previous_summary: str, lines: List[str]) -> str:
+        return f"""Current summary:
+{previous_summary or "None yet"}
+
+New lines:
+{chr(10).join(lines)}"""
 
     @staticmethod
     def create_evaluation_prompt(user_message: str) -> str:
-        return """For each Hebrew word the user used, provide a ONE sentence observation about their usage.
-        Focus on:
-        - Correctness of usage
-        - Understanding of meaning
-        - Any confusion or errors
-        - Grammatical accuracy
-
-        Format:
-        WORD: comment
-        
-        Example comments:
-        - "perfect usage in context"
-        - "used word incorrectly, confused with [other word]"
-        - "correct usage but wrong gender"
-        - "asked about meaning, needs reinforcement"
-        """
+        return f"User's message: {user_message}"
+
+    @staticmethod
+    def create_identification_prompt(candidates: List[str], query: str) -> str:
+        return f"""Candidate words: {', '.join(candidates)}
+
+Question: {query}"""
 
 @app.post("/assist/")
 async def assist(input_data: QueryInput):
-    user_progress = UserStorage.load_user_data(input_data.username)
-    
-    # Identify which words are being asked about
-    word_identification_prompt = f"""You are evaluating a Hebrew learner's question.
-    From this list of Hebrew words: {', '.join(FREQUENCY_LIST)}
-    For each relevant word, provide a ONE sentence observation about what they're asking.
-    
-    Format:
-    WORD: observation
-    
-    Example observations:
-    - "asked about basic meaning, does not know word"
-    - "perfect usage, asked about gender"
-    - "knows meaning, confused about usage context"
-    """
-    
-    evaluation = call_gpt_api([
-        {"role": "system", "content": word_identification_prompt},
-        {"role": "user", "content": input_data.query}
-    ])
+    # Identify which words are being asked about, offering the model only
+    # the vocabulary entries that actually appear in the query
+    candidates = CANDIDATE_MATCHER.match(input_data.query)
+    identification = acall_gpt_api([
+        {"role": "system", "content": IDENTIFICATION_INSTRUCTIONS},
+        {"role": "user", "content": PromptTemplate.create_identification_prompt(candidates, input_data.query)}
+    ], call_site=EVALUATION, json_output=True) if candidates else None
+
+    # The explanation depends only on the query, so learners share answers
+    cache_key = normalize_query(input_data.query)
+    explanation = None
+    if EXPLANATION_CACHE is not None and not input_data.no_cache:
+        explanation = EXPLANATION_CACHE.get(cache_key)
+
+    if explanation is not None:
+        evaluation = await await_evaluation(identification)
+    else:
+        explanation, evaluation = await call_concurrently(
+            acall_gpt_api([
+                {"role": "system", "content": EXPLANATION_INSTRUCTIONS},
+                {"role": "user", "content": input_data.query}
+            ], call_site=EXPLANATION),
+            identification
+        )
+        if EXPLANATION_CACHE is not None:
+            EXPLANATION_CACHE.set(cache_key, explanation)
 
     # Update word history with observations
-    for line in evaluation.split('\n'):
-        if ':' in line:
-            word, comment = line.split(':', 1)
-            word = word.strip()
-            comment = comment.strip()
-            
-            if word in FREQUENCY_LIST:
-                if word not in user_progress.word_history:
-                    user_progress.word_history[word] = WordHistory()
-                user_progress.word_history[word] = add_observation(
-                    user_progress.word_history[word],
-                    comment
-                )
-    
-    UserStorage.save_user_data(input_data.username, user_progress)
-
-    explanation = call_gpt_api([
-        {"role": "system", "content": "You are a Hebrew language assistant. Provide clear, helpful explanations in English."},
-        {"role": "user", "content": input_data.query}
-    ])
+    async with UserStorage.transaction(input_data.username) as user_progress:
+        apply_evaluation(user_progress, evaluation)
 
+    word_history, delta = word_history_update(user_progress, input_data.since_version)
     return {
         "response": explanation,
-        "word_history": user_progress.word_history
+        "word_history": word_history,
+        "version": user_progress.version,
+        "delta": delta
     }
 
-@app.post("/converse/", response_model=ConversationResponse)
-async def converse(input_data: ConversationInput):
+class Turn(NamedTuple):
+    """What a /converse/ turn read from the user's progress before its model calls"""
+    progress: UserProgress
+    role_play: Optional[str]
+    next_words: List[str]
+    review_words: List[str]
+    start_position: int
+
+def start_turn(input_data: ConversationInput) -> Turn:
     user_progress = UserStorage.load_user_data(input_data.username)
-    
-    if not user_progress.conversation_history:
-        user_progress.conversation_history = []
 
-    if input_data.role_play is not None:
-        user_progress.role_play = input_data.role_play
+    role_play = input_data.role_play if input_data.role_play is not None else user_progress.role_play
 
-    current_words = set(user_progress.word_history.keys())
-    next_words = [w for w in FREQUENCY_LIST[user_progress.current_position:] 
-                 if w not in current_words][:5]
+    # Due reviews first; new words, in frequency order, fill what is left of the turn
+    review_words = user_progress.words_due(now_seconds(), Config.WORDS_PER_TURN)
+    next_words = VOCABULARY.next_unlearned(
+        user_progress.current_position,
+        user_progress.word_history,
+        min(Config.NEW_WORDS_PER_TURN, Config.WORDS_PER_TURN - len(review_words))
+    )
+    return Turn(user_progress, role_play, next_words, review_words, user_progress.current_position)
 
-    response = call_gpt_api([
-        {"role": "system", "content": PromptTemplate.create_system_prompt()},
+def conversation_messages(input_data: ConversationInput, turn: Turn) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": PromptTemplate.create_system_prompt(turn.role_play)},
         {"role": "user", "content": PromptTemplate.create_conversation_prompt(
-            role_play=user_progress.role_play,
             user_message=input_data.user_message,
-            word_history=user_progress.word_history,
-            next_words=next_words,
-            conversation_history=user_progress.conversation_history
+            word_history=turn.progress.word_history,
+            next_words=turn.next_words,
+            review_words=turn.review_words,
+            conversation_history=turn.progress.conversation_history,
+            conversation_summary=turn.progress.conversation_summary
         )}
-    ])
-
-    evaluation = call_gpt_api([
-        {"role": "system", "content": "You are a Hebrew language evaluator."},
-        {"role": "user", "content": PromptTemplate.create_evaluation_prompt(input_data.user_message)}
-    ])
-
-    for line in evaluation.split('\n'):
-        if ':' in line:
-            word, comment = line.split(':', 1)
-            word = word.strip()
-            comment = comment.strip()
-            
-            if word in FREQUENCY_LIST:
-                if word not in user_progress.word_history:
-                    user_progress.word_history[word] = WordHistory()
-                user_progress.word_history[word] = add_observation(
-                    user_progress.word_history[word],
-                    comment
-                )
-
-    user_progress.conversation_history.extend([
-        f"User: {input_data.user_message}",
-        f"Assistant: {response}"
-    ])
-
-    user_progress.current_position = min(
-        user_progress.current_position + len(next_words),
-        len(FREQUENCY_LIST)
+    ]
+
+def evaluation_messages(user_message: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": EVALUATION_INSTRUCTIONS},
+        {"role": "user", "content": PromptTemplate.create_evaluation_prompt(user_message)}
+    ]
+
+async def evaluate_turn(username: str, job: Dict[str, str]):
+    """Evaluation queue handler: grade one turn's message and record the observations"""
+    evaluation = await acall_gpt_api(
+        evaluation_messages(job["user_message"]), call_site=EVALUATION, json_output=True, priority=BACKGROUND
     )
+    async with UserStorage.transaction(username) as user_progress:
+        apply_evaluation(user_progress, evaluation)
+    # The queue deletes the job when this returns, so the observations must be
+    # stored by then rather than left for the cache's next flush
+    await UserStorage.persist(username)
+
+EVALUATION_QUEUE = UserJobQueue(
+    Path(Config.EVALUATION_QUEUE_PATH),
+    handler=evaluate_turn,
+    workers=Config.EVALUATION_QUEUE_WORKERS,
+    max_attempts=Config.EVALUATION_QUEUE_MAX_ATTEMPTS,
+    retry_delay=Config.EVALUATION_QUEUE_RETRY_DELAY
+)
 
-    UserStorage.save_user_data(input_data.username, user_progress)
-
+def turn_evaluation(input_data: ConversationInput) -> Optional[Awaitable[str]]:
+    """The evaluation call to run alongside the reply, or None when turns are graded in the background"""
+    if Config.EVALUATION_IN_BACKGROUND:
+        return None
+    return acall_gpt_api(evaluation_messages(input_data.user_message), call_site=EVALUATION, json_output=True)
+
+async def finish_turn(
+    input_data: ConversationInput,
+    turn: Turn,
+    response: str,
+    evaluation: Optional[str]
+) -> ConversationResponse:
+    """
+    Save the turn. evaluation=None queues the message for background grading,
+    so the returned word_history does not include this turn's observations yet.
+    """
+    # Applied to the latest saved progress, not the snapshot the prompts were
+    # built from, so overlapping requests for the same user don't lose updates
+    async with UserStorage.transaction(input_data.username) as user_progress:
+        if evaluation is None:
+            # Inside the transaction, so a user's jobs are queued in turn order
+            EVALUATION_QUEUE.submit(input_data.username, {"user_message": input_data.user_message})
+        else:
+            apply_evaluation(user_progress, evaluation)
+
+        if input_data.role_play is not None:
+            user_progress.role_play = input_data.role_play
+
+        user_progress.conversation_history.extend([
+            f"User: {input_data.user_message}",
+            f"Assistant: {response}"
+        ])
+
+        # Overlapping turns pick the same next words; advance past them once
+        user_progress.current_position = max(user_progress.current_position, min(
+            turn.start_position + len(turn.next_words),
+            len(VOCABULARY)
+        ))
+
+    if len(user_progress.conversation_history) > Config.HISTORY_MAX_LINES:
+        schedule_summary(input_data.username)
+
+    word_history, delta = word_history_update(user_progress, input_data.since_version)
     return ConversationResponse(
         response=response,
-        word_history=user_progress.word_history,
-        next_words_to_learn=next_words,
-        current_position=user_progress.current_position
+        word_history=word_history,
+        next_words_to_learn=turn.next_words,
+        review_words=turn.review_words,
+        current_position=user_progress.current_position,
+        version=user_progress.version,
+        delta=delta
     )
 
+def schedule_summary(username: str):
+    """Fold the user's older conversation lines into their summary in the background, once at a time"""
+    if username in SUMMARIES_IN_FLIGHT:
+        return
+    SUMMARIES_IN_FLIGHT.add(username)
+    task = asyncio.ensure_future(summarize_history(username))
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    task.add_done_callback(lambda _: SUMMARIES_IN_FLIGHT.discard(username))
+
+async def summarize_history(username: str):
+    progress = UserStorage.load_user_data(username)
+    folded = progress.conversation_history[:-Config.HISTORY_RECENT_LINES]
+    first_seq = progress.archived_lines
+    if not folded:
+        return
+
+    try:
+        summary = await acall_gpt_api([
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": PromptTemplate.create_summary_prompt(progress.conversation_summary, folded)}
+        ], call_site=SUMMARY, priority=BACKGROUND)
+    except MODEL_ERRORS:
+        logger.warning("Summary call failed for %s, will retry on a later turn", username, exc_info=True)
+        return
+
+    async with UserStorage.transaction(username) as user_progress:
+        if user_progress.archived_lines != first_seq:
+            return
+        UserStorage.archive_conversation(username, folded, first_seq)
+        user_progress.conversation_history = user_progress.conversation_history[len(folded):]
+        user_progress.archived_lines += len(folded)
+        user_progress.conversation_summary = summary.strip()
+
+@app.post("/converse/", response_model=ConversationResponse)
+async def converse(input_data: ConversationInput):
+    turn = start_turn(input_data)
+    with span("build_prompts"):
+        messages = conversation_messages(input_data, turn)
+        evaluation_call = turn_evaluation(input_data)
+
+    response, evaluation = await call_concurrently(acall_gpt_api(messages, call_site=REPLY), evaluation_call)
+
+    return await finish_turn(input_data, turn, response, evaluation if evaluation_call is not None else None)
+
+async def reply_stream(input_data: ConversationInput, turn: Turn) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    One streamed turn, shared by /converse/stream/ and sessions:
+    - ("token", text) for reply text as the model produces it
+    - ("done", ConversationResponse) once the turn is saved
+    - ("error", detail) instead of "done" if the reply call fails; nothing is saved in that case
+    """
+    with span("build_prompts"):
+        messages = conversation_messages(input_data, turn)
+        evaluation_call = turn_evaluation(input_data)
+    evaluation_task = asyncio.ensure_future(evaluation_call) if evaluation_call is not None else None
+    try:
+        tokens = []
+        try:
+            async for token in astream_gpt_api(messages, call_site=REPLY):
+                tokens.append(token)
+                yield "token", token
+        except MODEL_ERRORS:
+            logger.warning("Streaming reply call failed", exc_info=True)
+            yield "error", "Language model request failed"
+            return
+
+        evaluation = await await_evaluation(evaluation_task) if evaluation_task is not None else None
+        yield "done", await finish_turn(input_data, turn, "".join(tokens), evaluation)
+    finally:
+        # Client went away or the reply failed: don't leave the evaluation running
+        if evaluation_task is not None and not evaluation_task.done():
+            evaluation_task.cancel()
+
+def event_data(event: str, payload: Any) -> str:
+    """JSON data of a reply_stream event"""
+    if event == "token":
+        return json.dumps({"text": payload}, ensure_ascii=False)
+    if event == "error":
+        return json.dumps({"detail": payload})
+    return payload.model_dump_json()
+
+@app.post("/converse/stream/")
+async def converse_stream(input_data: ConversationInput):
+    """
+    Server-sent events variant of /converse/:
+    - "token" events carry reply text as the model produces it
+    - a closing "done" event carries the ConversationResponse, sent after the word history is saved
+    - an "error" event replaces "done" if the reply call fails; nothing is saved in that case
+    """
+    turn = start_turn(input_data)
+
+    async def events():
+        async for event, payload in reply_stream(input_data, turn):
+            yield sse_event(event, event_data(event, payload))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class SessionTurnInput(BaseModel):
+    user_message: str
+    role_play: Optional[str] = None
+
+class SessionStart(BaseModel):
+    word_history: Dict[str, WordHistory]
+    next_words_to_learn: List[str]
+    review_words: List[str]
+    current_position: int
+    role_play: Optional[str]
+    version: int
+    delta: bool
+
+def socket_event(event: str, data: str) -> str:
+    return f'{{"event": "{event}", "data": {data}}}'
+
+async def send_event(websocket: WebSocket, event: str, data: str):
+    """Send a session event; a client gone mid-send ends the session as a disconnect does"""
+    try:
+        await websocket.send_text(socket_event(event, data))
+    except Exception as e:
+        # What a send to a closed client raises depends on the server: websockets'
+        # ConnectionClosed, uvicorn's ClientDisconnected, Starlette's RuntimeError
+        raise WebSocketDisconnect(1006) from e
+
+@app.websocket("/converse/session/")
+async def converse_session(websocket: WebSocket, username: str, role_play: Optional[str] = None,
+                           since_version: Optional[int] = None):
+    """
+    A whole sitting of /converse/ turns over one WebSocket. The user stays
+    resident in the user cache while the session is open. The client's
+    word_history version is tracked, so every "done" event carries only
+    what changed since the previous one.
+    - the server first sends a "session" event: the word history (a delta when since_version is known),
+      next words, position and version
+    - the client then sends {"user_message": ..., "role_play": optional} per turn and gets the
+      same "token"/"done"/"error" events as /converse/stream/, as {"event": ..., "data": ...}
+    - the user is written to the store every SESSION_CHECKPOINT_TURNS turns (0 = no checkpoints) and when the session ends
+    - binary frames get an "error" event
+    - sessions idle for SESSION_IDLE_SECONDS are closed; past SESSION_MAX_PER_WORKER, new ones are refused
+    """
+    if len(OPEN_SESSIONS) >= Config.SESSION_MAX_PER_WORKER:
+        SESSION_STATS["rejected"] += 1
+        await websocket.close(code=1013)  # try again later
+        return
+    await websocket.accept()
+    OPEN_SESSIONS.add(websocket)
+    SESSION_STATS["opened"] += 1
+    UserStorage.pin(username)
+    try:
+        turn = start_turn(ConversationInput(username=username, user_message="", role_play=role_play))
+        word_history, delta = word_history_update(turn.progress, since_version)
+        version = turn.progress.version
+        await send_event(websocket, "session", SessionStart(
+            word_history=word_history,
+            next_words_to_learn=turn.next_words,
+            review_words=turn.review_words,
+            current_position=turn.progress.current_position,
+            role_play=turn.role_play,
+            version=version,
+            delta=delta
+        ).model_dump_json())
+
+        turns = 0
+        while True:
+            try:
+                received = await asyncio.wait_for(websocket.receive(), timeout=Config.SESSION_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                SESSION_STATS["timed_out"] += 1
+                await websocket.close(code=1000, reason="idle")
+                return
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000))
+            message = received.get("text")
+            if message is None:
+                await send_event(websocket, "error", '{"detail": "turns must be sent as text frames"}')
+                continue
+            try:
+                turn_input = SessionTurnInput.model_validate_json(message)
+            except ValidationError as e:
+                await send_event(websocket, "error", f'{{"detail": {e.json(include_url=False)}}}')
+                continue
+
+            role_play = turn_input.role_play if turn_input.role_play is not None else role_play
+            input_data = ConversationInput(username=username, user_message=turn_input.user_message,
+                                           role_play=role_play, since_version=version)
+            turn = start_turn(input_data)
+            async with aclosing(reply_stream(input_data, turn)) as events:
+                async for event, payload in events:
+                    if event == "done":
+                        version = payload.version
+                    await send_event(websocket, event, event_data(event, payload))
+
+            turns += 1
+            SESSION_STATS["turns"] += 1
+            if Config.SESSION_CHECKPOINT_TURNS > 0 and turns % Config.SESSION_CHECKPOINT_TURNS == 0:
+                await UserStorage.persist(username)
+                SESSION_STATS["checkpoints"] += 1
+    except WebSocketDisconnect:
+        pass
+    finally:
+        OPEN_SESSIONS.discard(websocket)
+        UserStorage.unpin(username)
+        await UserStorage.persist(username)
+
+def batch_evaluation_messages(messages: List[str], chunk: List[int]) -> List[Dict[str, str]]:
+    numbered = "\n".join(f"[{index}] {' '.join(messages[index].split())}" for index in chunk)
+    return [
+        {"role": "system", "content": BATCH_EVALUATION_INSTRUCTIONS},
+        {"role": "user", "content": numbered}
+    ]
+
+@app.post("/evaluate/batch/")
+async def evaluate_batch(input_data: BatchEvaluationInput):
+    """
+    Grade many learner messages without generating replies.
+    Messages are packed into model calls up to a token budget, the calls run
+    with bounded concurrency, and every observation is applied to the user in
+    a single save. Each message's result is reported by its index:
+    - "ok": evaluated (possibly with no vocabulary words)
+    - "failed": its model call failed or returned unusable output
+    - "missing": the model's output left the message out
+    - "skipped": the message was blank
+    """
+    messages = input_data.messages
+    chunks = chunk_messages(messages, Config.BATCH_EVALUATION_MAX_TOKENS, Config.BATCH_EVALUATION_MAX_MESSAGES)
+    slots = asyncio.Semaphore(Config.BATCH_EVALUATION_CONCURRENCY)
+
+    async def evaluate_chunk(chunk: List[int]) -> Optional[Dict[int, ParsedEvaluation]]:
+        async with slots:
+            try:
+                output = await acall_gpt_api(
+                    batch_evaluation_messages(messages, chunk), call_site=EVALUATION, json_output=True, priority=BATCH
+                )
+            except MODEL_ERRORS:
+                logger.warning("Batch evaluation call for %d messages failed", len(chunk), exc_info=True)
+                return None
+        return parse_batch_evaluation(output, VOCABULARY, chunk)
+
+    outcomes = await asyncio.gather(*(evaluate_chunk(chunk) for chunk in chunks))
+
+    statuses = ["skipped"] * len(messages)
+    parsed: Dict[int, ParsedEvaluation] = {}
+    for chunk, outcome in zip(chunks, outcomes):
+        for index in chunk:
+            if outcome is None:
+                statuses[index] = "failed"
+            elif index in outcome:
+                statuses[index] = "ok"
+                parsed[index] = outcome[index]
+            else:
+                statuses[index] = "missing"
+
+    async with UserStorage.transaction(input_data.username) as user_progress:
+        for index in sorted(parsed):
+            for word, comment in parsed[index].observations:
+                user_progress.add_observation(word, comment)
+
+    return {
+        "results": [{
+            "index": index,
+            "status": status,
+            "observations": [{"word": word, "comment": comment} for word, comment in parsed[index].observations]
+                            if index in parsed else [],
+            "unmatched_words": parsed[index].unmatched if index in parsed else 0
+        } for index, status in enumerate(statuses)],
+        "model_calls": len(chunks),
+        "observations": sum(len(result.observations) for result in parsed.values())
+    }
+
+def progress_etag(progress: UserProgress, *view) -> str:
+    """Weak ETag of a progress view, from the fields that change whenever the record does"""
+    state = (progress.version, progress.current_position, progress.archived_lines,
+             len(progress.conversation_history), progress.role_play, progress.conversation_summary, *view)
+    return f'W/"{hashlib.sha1(repr(state).encode("utf-8")).hexdigest()[:20]}"'
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 @app.get("/user/{username}/progress")
-async def get_user_progress(username: str):
+async def get_user_progress(
+    username: str,
+    response: Response,
+    lean: bool = False,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PROGRESS_PAGE),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Mastery stats for a user, read from the counts kept as observations are recorded.
+    - lean=false returns the whole progress record and every word's status
+    - lean=true leaves out the raw history and pages through the words with offset/limit
+    Responses carry an ETag; a request with a matching If-None-Match gets 304 Not Modified.
+    """
     progress = UserStorage.load_user_data(username)
-    
+    etag = progress_etag(progress, lean, offset, limit)
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    stats = {
+        "total_words": len(VOCABULARY),
+        "mastered_words": progress.mastered_count,
+        "reinforcement_words": progress.reinforcement_count,
+        "current_position": progress.current_position,
+        "completion_percentage": (progress.mastered_count / len(VOCABULARY)) * 100
+    }
+
+    if lean:
+        page = itertools.islice(progress.word_history.items(), offset, offset + limit)
+        return {
+            "stats": stats,
+            "words": [{
+                "word": word,
+                "status": history.status,
+                "error_count": history.error_count,
+                "observation_count": len(history.observations),
+                "last_used": history.last_used
+            } for word, history in page],
+            "offset": offset,
+            "limit": limit,
+            "total": len(progress.word_history)
+        }
+
     word_status = {
         "mastered": [],
         "needs_reinforcement": [],
         "new": []
     }
-    
     for word, history in progress.word_history.items():
-        if history.observations:
-            latest_comment = history.observations[-1]["comment"].lower()
-            if "perfect" in latest_comment and "asked" not in latest_comment:
-                word_status["mastered"].append(word)
-            else:
-                word_status["needs_reinforcement"].append(word)
-    
+        if history.status is not None:
+            word_status[history.status].append(word)
+
     return {
         "progress": progress,
-        "stats": {
-            "total_words": len(FREQUENCY_LIST),
-            "mastered_words": len(word_status["mastered"]),
-            "reinforcement_words": len(word_status["needs_reinforcement"]),
-            "current_position": progress.current_position,
-            "completion_percentage": (len(word_status["mastered"]) / len(FREQUENCY_LIST)) * 100
-        },
+        "stats": stats,
         "word_status": word_status
-    }
\ No newline at end of file
+    }
+
+def token_usage_samples():
+    return [({"site": site, "kind": kind}, counts[f"{kind}_tokens"])
+            for site, counts in TOKEN_USAGE.counts.items() for kind in ("prompt", "cached", "completion")]
+
+def scheduler_samples():
+    return [({"stat": name}, value) for name, value in get_scheduler().stats().items()]
+
+register_collector("app_model_tokens_total", "counter", "Tokens reported by the model per call site", token_usage_samples)
+register_collector("app_model_calls_total", "counter", "Completed model calls per call site",
+                   lambda: [({"site": site}, counts["calls"]) for site, counts in TOKEN_USAGE.counts.items()])
+register_collector("app_evaluation_queue", "gauge", "Background evaluation queue state and counters",
+                   lambda: [({"stat": name}, value) for name, value in EVALUATION_QUEUE.stats().items()])
+register_collector("app_model_scheduler", "gauge", "Model call scheduler state and counters", scheduler_samples)
+
+@app.get("/health/live")
+async def get_liveness():
+    """The worker is up and its event loop is answering"""
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready")
+async def get_readiness():
+    """200 once startup has run; 503 before that and once the worker is draining for shutdown"""
+    if WORKER_STATE["draining"]:
+        return JSONResponse({"status": "draining", "pid": os.getpid()}, status_code=503)
+    if not WORKER_STATE["ready"]:
+        return JSONResponse({"status": "starting", "pid": os.getpid()}, status_code=503)
+    return {"status": "ready", "pid": os.getpid()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format: phase and request latency histograms, token counts, scheduler state"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile")
+async def get_profile(reset: bool = False):
+    """Event loop stacks sampled since startup (or the last reset), folded for flame graph tools"""
+    if PROFILER is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled, set PROFILER_ENABLED=true")
+    profile = PROFILER.collapsed()
+    if reset:
+        PROFILER.reset()
+    return PlainTextResponse(profile)
+
+@app.get("/stats/evaluation-parser")
+async def get_evaluation_parser_stats():
+    return dict(PARSE_STATS)
+
+@app.get("/stats/model-calls")
+async def get_model_call_stats():
+    return get_scheduler().stats()
+
+@app.get("/stats/prompt-cache")
+async def get_prompt_cache_stats():
+    """Prompt, cached prompt and completion tokens per call site, as reported by the model"""
+    return TOKEN_USAGE.stats()
+
+@app.get("/stats/evaluation-queue")
+async def get_evaluation_queue_stats():
+    return {"background": Config.EVALUATION_IN_BACKGROUND, **EVALUATION_QUEUE.stats()}
+
+@app.get("/stats/sessions")
+async def get_session_stats():
+    return {"open": len(OPEN_SESSIONS), "max": Config.SESSION_MAX_PER_WORKER,
+            **{name: SESSION_STATS[name] for name in ("opened", "rejected", "timed_out", "turns", "checkpoints")}}
+
+@app.get("/stats/explanation-cache")
+async def get_explanation_cache_stats():
+    if EXPLANATION_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **EXPLANATION_CACHE.stats()}
+
+@app.get("/stats/user-cache")
+async def get_user_cache_stats():
+    if UserStorage.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **UserStorage.cache.stats()}
@@ -1,5 +1,15 @@
-
+import re
+from functools import lru_cache
 from pathlib import Path
+from typing import Container, Dict, Iterator, List, Optional
+
+NIQQUD = re.compile("[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]")  # vowel points and cantillation
+FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+HEBREW_TOKEN = re.compile("[א-ת]+(?:[\"'׳״][א-ת]+)*")  # allows צה"ל-style acronyms
+GERESH = re.compile("[\"'׳״]")
+PREFIX_LETTERS = "והבלמשכ"
+MAX_PREFIXES = 3
+MIN_STEM_LENGTH = 2
 
 def get_data_list():
     file_path = Path(__file__).parent / "one_thousand_common_words.txt"
@@ -9,3 +19,111 @@ def get_data_list():
 
     return data_list
 
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized Hebrew tokens, dropping niqqud, punctuation and non-Hebrew words"""
+    text = NIQQUD.sub("", text).translate(FINAL_LETTERS)
+    return [GERESH.sub("", token) for token in HEBREW_TOKEN.findall(text)]
+
+def normalize_word(word: str) -> str:
+    """Normalized lookup key for a vocabulary entry; multi-word entries keep single spaces"""
+    return " ".join(tokenize(word))
+
+def strip_prefixes(token: str) -> Iterator[str]:
+    """Yield the token, then the token with up to MAX_PREFIXES leading prefix letters (ו/ה/ב/ל/מ/ש/כ) removed"""
+    yield token
+    for _ in range(MAX_PREFIXES):
+        if len(token) - 1 < MIN_STEM_LENGTH or token[0] not in PREFIX_LETTERS:
+            return
+        token = token[1:]
+        yield token
+
+class Vocabulary:
+    """
+    Frequency-ranked word list indexed for constant-time lookups.
+    Positions match the order of the source list, so a user's current_position
+    can be used directly as a rank.
+    """
+
+    def __init__(self, words: List[str]):
+        self.words = list(words)
+        self._ranks: Dict[str, int] = {}
+        self._aliases: Dict[str, List[str]] = {}
+        self.max_phrase_length = 1
+        for rank, word in enumerate(self.words):
+            if not word or word in self._ranks:
+                continue
+            self._ranks[word] = rank
+            key = normalize_word(word)
+            if key:
+                self._aliases.setdefault(key, []).append(word)
+                self.max_phrase_length = max(self.max_phrase_length, key.count(" ") + 1)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ranks
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.words)
+
+    def rank(self, word: str) -> Optional[int]:
+        """Position of the word's first occurrence in the frequency list"""
+        return self._ranks.get(word)
+
+    def aliases(self, key: str) -> List[str]:
+        """Vocabulary entries whose normalized form is key"""
+        return self._aliases.get(key, [])
+
+    def lookup(self, word: str) -> Optional[str]:
+        """Vocabulary entry for a word as written: exact, then normalized, then with prefixes stripped"""
+        if word in self._ranks:
+            return word
+        tokens = tokenize(word)
+        if not tokens:
+            return None
+        for stem in strip_prefixes(tokens[0]):
+            entries = self.aliases(" ".join([stem, *tokens[1:]]))
+            if entries:
+                return entries[0]
+        return None
+
+    def next_unlearned(self, position: int, known: Container[str], count: int) -> List[str]:
+        """
+        The first `count` words at or after `position` that are not in `known`.
+        Stops as soon as enough words are found, so the cost depends on `count`
+        and the known words passed over, not on the vocabulary size.
+        """
+        found: List[str] = []
+        if count <= 0:
+            return found
+        for rank in range(position, len(self.words)):
+            word = self.words[rank]
+            if self._ranks.get(word) == rank and word not in known:
+                found.append(word)
+                if len(found) == count:
+                    break
+        return found
+
+@lru_cache(maxsize=None)
+def get_vocabulary() -> Vocabulary:
+    """The frequency list as a Vocabulary, built once per process"""
+    return Vocabulary(get_data_list())
+
+class CandidateMatcher:
+    """Finds the vocabulary entries a free-text query may refer to"""
+
+    def __init__(self, vocabulary: Vocabulary):
+        self.vocabulary = vocabulary
+
+    def match(self, text: str) -> List[str]:
+        """Vocabulary entries found in text, in order of appearance"""
+        tokens = tokenize(text)
+        found: Dict[str, None] = {}
+        for i, token in enumerate(tokens):
+            for length in range(1, min(self.vocabulary.max_phrase_length, len(tokens) - i) + 1):
+                rest = tokens[i + 1:i + length]
+                for stem in strip_prefixes(token):
+                    for word in self.vocabulary.aliases(" ".join([stem, *rest])):
+                        found.setdefault(word)
+        return list(found)
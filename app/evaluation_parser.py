@@ -0,0 +1,122 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from .data.data_processing import Vocabulary
+
+class EvaluatedWord(BaseModel):
+    word: str
+    comment: str
+
+class EvaluationOutput(BaseModel):
+    """The JSON object evaluation prompts ask the model for"""
+    observations: List[EvaluatedWord]
+
+class MessageEvaluation(BaseModel):
+    index: int
+    observations: List[EvaluatedWord]
+
+class BatchEvaluationOutput(BaseModel):
+    """The JSON object batch evaluation prompts ask the model for, one entry per numbered message"""
+    messages: List[MessageEvaluation]
+
+class ParsedEvaluation(NamedTuple):
+    observations: List[Tuple[str, str]]  # (vocabulary word, comment)
+    structured: bool  # parsed as JSON rather than legacy text
+    unparsed: int  # lines that did not look like "WORD: comment"
+    unmatched: int  # words not found in the vocabulary
+
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+LIST_MARKER = re.compile(r"^\s*(?:[-*•]+|\d+[.)])\s*")
+EMPHASIS = re.compile(r"\*\*|__|`")
+SEPARATOR = re.compile(r"\s*(?::|\s[-–—]\s)\s*")
+QUOTES = "\"'“”„«»׳״ "
+
+# Totals since startup, for monitoring how often evaluator output is lost
+PARSE_STATS: Counter = Counter()
+
+def parse_evaluation(text: str, vocabulary: Vocabulary) -> ParsedEvaluation:
+    """
+    Parse evaluator output into (vocabulary word, comment) pairs.
+    JSON matching EvaluationOutput is validated in a single pass; anything else
+    goes through the tolerant line parser for the legacy "WORD: comment" format.
+    Words are mapped to vocabulary entries, so niqqud and prefixed forms count.
+    """
+    try:
+        output = EvaluationOutput.model_validate_json(CODE_FENCE.sub("", text))
+        pairs = [(item.word, item.comment) for item in output.observations]
+        structured, unparsed = True, 0
+    except ValidationError:
+        pairs, unparsed = parse_legacy_lines(text)
+        structured = False
+
+    observations, unmatched = map_words(pairs, vocabulary)
+    PARSE_STATS["structured" if structured else "legacy"] += 1
+    PARSE_STATS["unparsed_lines"] += unparsed
+    return ParsedEvaluation(observations, structured, unparsed, unmatched)
+
+def parse_batch_evaluation(
+    text: str,
+    vocabulary: Vocabulary,
+    indices: Iterable[int]
+) -> Optional[Dict[int, ParsedEvaluation]]:
+    """
+    Parse the output of a batch evaluation prompt into one ParsedEvaluation per
+    message index. Returns None when the output is not valid BatchEvaluationOutput
+    JSON: without the numbering, observations cannot be attributed to messages.
+    Indices the model left out, or that were not asked for, are not returned.
+    """
+    try:
+        output = BatchEvaluationOutput.model_validate_json(CODE_FENCE.sub("", text))
+    except ValidationError:
+        PARSE_STATS["batch_failed"] += 1
+        return None
+
+    wanted = set(indices)
+    results = {}
+    for message in output.messages:
+        if message.index not in wanted or message.index in results:
+            continue
+        observations, unmatched = map_words([(item.word, item.comment) for item in message.observations], vocabulary)
+        results[message.index] = ParsedEvaluation(observations, True, 0, unmatched)
+    PARSE_STATS["batch"] += 1
+    PARSE_STATS["batch_missing_messages"] += len(wanted - results.keys())
+    return results
+
+def map_words(pairs: List[Tuple[str, str]], vocabulary: Vocabulary) -> Tuple[List[Tuple[str, str]], int]:
+    """Map evaluated words to vocabulary entries, counting the ones not in the vocabulary"""
+    observations, unmatched = [], 0
+    for word, comment in pairs:
+        entry = vocabulary.lookup(word.strip(QUOTES))
+        if entry is None:
+            unmatched += 1
+            continue
+        observations.append((entry, comment.strip().strip(QUOTES)))
+    PARSE_STATS["observations"] += len(observations)
+    PARSE_STATS["unmatched_words"] += unmatched
+    return observations, unmatched
+
+def parse_legacy_lines(text: str) -> Tuple[List[Tuple[str, str]], int]:
+    """'WORD: comment' lines, tolerating bullets, numbering, bold markdown and dash separators"""
+    pairs, unparsed = [], 0
+    for line in text.splitlines():
+        line = EMPHASIS.sub("", LIST_MARKER.sub("", line)).strip()
+        if not line:
+            continue
+        pair = split_line(line)
+        if pair is None:
+            unparsed += 1
+        else:
+            pairs.append(pair)
+    return pairs, unparsed
+
+def split_line(line: str) -> Optional[Tuple[str, str]]:
+    match = SEPARATOR.search(line)
+    if match is None or match.start() == 0:
+        return None
+    word, comment = line[:match.start()], line[match.end():]
+    if not comment:
+        return None
+    return word, comment
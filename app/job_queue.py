@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .sqlite_connection import ReopenableConnection
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+WAIT_INTERVAL = 0.2  # seconds between checks while another process runs a user's earlier job
+STOP_TIMEOUT = 5.0  # seconds stop() waits for the workers
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class _Job:
+    __slots__ = ("id", "payload", "attempts")
+
+    def __init__(self, job_id: int, payload: Dict[str, Any], attempts: int = 0):
+        self.id = job_id
+        self.payload = payload
+        self.attempts = attempts
+
+class UserJobQueue(ReopenableConnection):
+    """
+    Background jobs run by a pool of workers, persisted in SQLite until done.
+    - a user's jobs run one at a time, in the order they were submitted, also
+      across processes sharing the database: a job waits while an earlier job
+      of the same user is stored by another process
+    - a job whose handler raises is retried after retry_delay * 2**attempts
+      seconds, holding back that user's later jobs, and dropped after max_attempts
+    - jobs left by a stopped or crashed process are picked up by the next start()
+    A job is deleted once its handler returns, so one interrupted mid-way runs again.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        owner INTEGER,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_username ON jobs (username, id);
+    """
+
+    def __init__(self, db_path: Path, handler: Handler, workers: int, max_attempts: int, retry_delay: float):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        super().__init__(db_path)
+        self._conn.executescript(self.SCHEMA)
+
+        self._pending: Dict[str, Deque[_Job]] = {}  # username: jobs in submission order
+        self._ready: Deque[str] = deque()  # users whose next job can run now
+        self._jobs = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._stopping = False
+
+        self.counts: Counter = Counter()  # submitted, resumed, completed, retried, dropped, waited
+
+    def submit(self, username: str, payload: Dict[str, Any]):
+        """Store a job for username and run it after the user's earlier jobs"""
+        with self._lock:
+            job_id = self._conn.execute(
+                "INSERT INTO jobs (username, payload, owner, created_at) VALUES (?, ?, ?, ?)",
+                (username, json.dumps(payload, ensure_ascii=False), os.getpid(), time.time())
+            ).lastrowid
+        self.counts["submitted"] += 1
+        self._add(username, _Job(job_id, payload))
+        self._ensure_workers()
+
+    def start(self):
+        """Take over jobs that no running process owns and start the workers; needs a running loop"""
+        self._stopping = False
+        with self._lock:
+            owners = [owner for (owner,) in self._conn.execute("SELECT DISTINCT owner FROM jobs")]
+            # Jobs under this process's own pid that it has not queued are a previous
+            # run's too: a restarted container's main process gets the same pid
+            orphaned = [owner for owner in owners
+                        if owner is None or owner == os.getpid() or not process_alive(owner)]
+            rows = []
+            for owner in orphaned:
+                if owner is None:
+                    self._conn.execute("UPDATE jobs SET owner = ? WHERE owner IS NULL", (os.getpid(),))
+                elif owner != os.getpid():
+                    self._conn.execute("UPDATE jobs SET owner = ? WHERE owner = ?", (os.getpid(), owner))
+            if orphaned:
+                rows = self._conn.execute(
+                    "SELECT id, username, payload, attempts FROM jobs WHERE owner = ? ORDER BY id", (os.getpid(),)
+                ).fetchall()
+        known = {job.id for jobs in self._pending.values() for job in jobs}
+        for job_id, username, payload, attempts in rows:
+            if job_id not in known:
+                self._add(username, _Job(job_id, json.loads(payload), attempts))
+                self.counts["resumed"] += 1
+        self._ensure_workers()
+
+    def _add(self, username: str, job: _Job):
+        jobs = self._pending.setdefault(username, deque())
+        jobs.append(job)
+        self._jobs += 1
+        if self._idle is not None:
+            self._idle.clear()
+        if len(jobs) == 1:
+            self._make_ready(username)
+
+    def _make_ready(self, username: str):
+        self._timers.pop(username, None)
+        self._ready.append(username)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_workers(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): jobs stay stored until an app starts
+            return
+        if self._stopping:
+            # Jobs submitted while stopping stay stored for the next start()
+            return
+        if self._loop is loop and self._tasks and all(not task.done() for task in self._tasks):
+            return
+        # First start, or a new event loop (tests and benchmarks call asyncio.run more than once)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        if self._jobs == 0:
+            self._idle.set()
+        if self._ready:
+            self._wakeup.set()
+        for username in list(self._timers):
+            # Backoff timers of an old loop never fire
+            self._make_ready(username)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def _work(self):
+        while not self._stopping:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run_next(self._ready.popleft())
+
+    def _earlier_job_stored(self, username: str, job_id: int) -> bool:
+        """
+        Whether another process still has an earlier job of the user; ids grow in
+        submission order. This process's own jobs are ordered by _pending
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM jobs WHERE username = ? AND id < ? AND owner IS NOT ? LIMIT 1",
+                (username, job_id, os.getpid())
+            ).fetchone() is not None
+
+    async def _run_next(self, username: str):
+        job = self._pending[username][0]
+        if self._earlier_job_stored(username, job.id):
+            # Its row goes once its observations are saved (or it is dropped); a
+            # dead process's jobs are taken over by its replacement's start()
+            self.counts["waited"] += 1
+            self._timers[username] = asyncio.get_running_loop().call_later(WAIT_INTERVAL, self._make_ready, username)
+            return
+        try:
+            await self.handler(username, job.payload)
+        except asyncio.CancelledError:
+            # Stopping: the job stays stored, and queued first for this user
+            self._ready.appendleft(username)
+            raise
+        except Exception:
+            job.attempts += 1
+            if job.attempts < self.max_attempts:
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                logger.warning("Job %d for %s failed (attempt %d), retrying in %.1fs",
+                               job.id, username, job.attempts, delay, exc_info=True)
+                with self._lock:
+                    self._conn.execute("UPDATE jobs SET attempts = ? WHERE id = ?", (job.attempts, job.id))
+                self.counts["retried"] += 1
+                self._timers[username] = asyncio.get_running_loop().call_later(delay, self._make_ready, username)
+                return
+            logger.error("Job %d for %s failed %d times, dropping it", job.id, username, job.attempts, exc_info=True)
+            self.counts["dropped"] += 1
+        else:
+            self.counts["completed"] += 1
+
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+        jobs = self._pending[username]
+        jobs.popleft()
+        self._jobs -= 1
+        if jobs:
+            self._make_ready(username)
+        else:
+            del self._pending[username]
+            if self._jobs == 0 and self._idle is not None:
+                self._idle.set()
+
+    async def join(self):
+        """Wait until every submitted job has finished or been dropped"""
+        self._ensure_workers()
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def stop(self, timeout: float = STOP_TIMEOUT):
+        """
+        Stop the workers, waiting at most timeout seconds for them; unfinished
+        jobs stay stored for the next start()
+        """
+        self._stopping = True
+        for timer in self._timers.values():
+            timer.cancel()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        tasks = [task for task in self._tasks if task.get_loop() is asyncio.get_running_loop()]
+        for task in tasks:
+            # Idle workers see _stopping; cancelling interrupts the running jobs
+            task.cancel()
+        if tasks:
+            _, stuck = await asyncio.wait(tasks, timeout=timeout)
+            if stuck:
+                logger.warning("%d queue workers did not stop within %.1fs", len(stuck), timeout)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending_jobs": self._jobs,
+            "pending_users": len(self._pending),
+            "backing_off_users": len(self._timers),
+            **{name: self.counts[name] for name in ("submitted", "resumed", "completed", "retried", "dropped", "waited")}
+        }
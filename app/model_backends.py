@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import random
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+
+import httpx
+from openai import AsyncOpenAI
+
+from .config import CallSettings, Config
+from .stub_responses import split_tokens, stub_completion
+from .tracing import annotate
+from .word_knowledge import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class TokenUsage:
+    """Prompt, cached prompt and completion tokens reported by the model, per call site"""
+
+    def __init__(self):
+        self.counts: Dict[str, Counter] = {}
+
+    def record(self, site: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int):
+        counts = self.counts.setdefault(site, Counter())
+        counts["calls"] += 1
+        counts["prompt_tokens"] += prompt_tokens
+        counts["cached_tokens"] += cached_tokens
+        counts["completion_tokens"] += completion_tokens
+        annotate(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens)
+        logger.info("Model call site=%s prompt_tokens=%d cached_tokens=%d completion_tokens=%d",
+                    site, prompt_tokens, cached_tokens, completion_tokens)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {site: {
+            **counts,
+            "cached_fraction": counts["cached_tokens"] / counts["prompt_tokens"] if counts["prompt_tokens"] else 0.0
+        } for site, counts in self.counts.items()}
+
+TOKEN_USAGE = TokenUsage()
+
+def record_usage(site: str, usage):
+    """
+    Count an OpenAI usage block. cached_tokens sits under prompt_tokens_details,
+    which this client version doesn't model, so it may arrive as a plain dict.
+    """
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    else:
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt, completion = usage.prompt_tokens, usage.completion_tokens
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    TOKEN_USAGE.record(site, prompt or 0, cached or 0, completion or 0)
+
+class OpenAIBackend:
+    """Chat completions on api.openai.com, or on any OpenAI-compatible server at base_url"""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], max_connections: int,
+                 stream_usage: bool = True):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        # Ask for a closing usage chunk on streams; some compatible servers reject the option
+        self.stream_usage = stream_usage
+        # Created lazily so the connection pool binds to the event loop of
+        # the worker that serves requests, not the importing process
+        self._client: Optional[AsyncOpenAI] = None
+
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,  # retries are scheduled by call_gpt_api
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    )
+                )
+            )
+        return self._client
+
+    @staticmethod
+    def _options(settings: CallSettings, timeout: Optional[float], json_output: bool) -> dict:
+        options = {
+            "model": settings.model,
+            "temperature": settings.temperature,
+            "timeout": timeout if timeout is not None else settings.timeout,
+        }
+        if settings.max_tokens is not None:
+            options["max_tokens"] = settings.max_tokens
+        if json_output:
+            options["response_format"] = {"type": "json_object"}
+        return options
+
+    async def complete(self, messages, site: str, settings: CallSettings,
+                       timeout: Optional[float] = None, json_output: bool = False) -> str:
+        response = await self.client().chat.completions.create(
+            messages=messages,
+            **self._options(settings, timeout, json_output)
+        )
+        record_usage(site, response.usage)
+        return response.choices[0].message.content
+
+    async def stream(self, messages, site: str, settings: CallSettings,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        stream = await self.client().chat.completions.create(
+            messages=messages,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}} if self.stream_usage else None,
+            **self._options(settings, timeout, json_output=False)
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # Only the closing chunk carries usage; this client version keeps it as an extra field
+            record_usage(site, getattr(chunk, "usage", None))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+class PrefixCache:
+    """
+    Imitates provider prompt caching: the longest prefix of a prompt already
+    seen, in whole blocks of block_tokens and only once it reaches min_tokens,
+    counts as cached. Tokens are estimated from characters.
+    """
+
+    def __init__(self, min_tokens: int = 1024, block_tokens: int = 128, max_entries: int = 100_000):
+        self.min_tokens = min_tokens
+        self.block_chars = int(block_tokens * CHARS_PER_TOKEN)
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+
+    def lookup(self, messages) -> int:
+        """Cached tokens for this prompt; remembers its prefixes for later calls"""
+        text = "".join(f"{message['role']}\n{message['content']}\n" for message in messages)
+        digest = hashlib.sha1()
+        cached_chars = 0
+        for end in range(self.block_chars, len(text) + 1, self.block_chars):
+            digest.update(text[end - self.block_chars:end].encode("utf-8"))
+            key = digest.copy().digest()
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                cached_chars = end
+            else:
+                self._seen[key] = None
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        cached = int(cached_chars / CHARS_PER_TOKEN)
+        return cached if cached >= self.min_tokens else 0
+
+class StubBackend:
+    """
+    In-process model for offline load tests: no network, credentials or spend.
+    - every call waits latency seconds plus up to jitter more, drawn from a seeded RNG
+    - responses[site] scripts the answers for a call site, cycled in order;
+      sites without a script get stub_completion's canned answers
+    - streamed answers are split into word tokens with the latency spread across them
+    - usage is reported like the provider's, with cached tokens from a PrefixCache
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0,
+                 responses: Optional[Dict[str, Union[str, List[str]]]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._scripts: Dict[str, Iterator[str]] = {
+            site: itertools.cycle([script] if isinstance(script, str) else script)
+            for site, script in (responses or {}).items() if script
+        }
+        self.calls: Counter = Counter()  # site: completions served
+        self.prefix_cache = PrefixCache()
+
+    def _delay(self) -> float:
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _content(self, messages, site: str, json_output: bool) -> str:
+        self.calls[site] += 1
+        script = self._scripts.get(site)
+        content = next(script) if script is not None else stub_completion(messages, json_output)
+        prompt = sum(estimate_tokens(message["content"]) for message in messages)
+        TOKEN_USAGE.record(site, prompt, min(self.prefix_cache.lookup(messages), prompt), estimate_tokens(content))
+        return content
+
+    async def complete(self, messages, site: str, settings: CallSettings,
+                       timeout: Optional[float] = None, json_output: bool = False) -> str:
+        await asyncio.sleep(self._delay())
+        return self._content(messages, site, json_output)
+
+    async def stream(self, messages, site: str, settings: CallSettings,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        delay = self._delay()
+        tokens = split_tokens(self._content(messages, site, json_output=False))
+        for token in tokens:
+            await asyncio.sleep(delay / len(tokens))
+            yield token
+
+    async def close(self):
+        pass
+
+def load_stub_responses(path: Optional[str]) -> Optional[Dict[str, Union[str, List[str]]]]:
+    if not path:
+        return None
+    with open(Path(path), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def create_backend():
+    if Config.MODEL_BACKEND == "stub":
+        return StubBackend(
+            latency=Config.STUB_LATENCY,
+            jitter=Config.STUB_JITTER,
+            seed=Config.STUB_SEED,
+            responses=load_stub_responses(Config.STUB_RESPONSES_PATH)
+        )
+    if Config.MODEL_BACKEND == "openai_compatible":
+        if not Config.GPT_BASE_URL:
+            raise ValueError("MODEL_BACKEND=openai_compatible needs GPT_BASE_URL")
+        # Local servers usually ignore the key, but the client insists on one
+        return OpenAIBackend(Config.GPT_API_KEY or "unused", Config.GPT_BASE_URL, Config.GPT_MAX_CONNECTIONS,
+                             stream_usage=Config.GPT_STREAM_USAGE)
+    if Config.MODEL_BACKEND == "openai":
+        return OpenAIBackend(Config.GPT_API_KEY, Config.GPT_BASE_URL, Config.GPT_MAX_CONNECTIONS)
+    raise ValueError(f"Unknown MODEL_BACKEND {Config.MODEL_BACKEND!r}")
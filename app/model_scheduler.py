@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Priorities, lowest first: a waiting call is only started once every call
+# of a more urgent priority that is waiting has started
+INTERACTIVE = 0  # a learner is waiting on the answer
+BACKGROUND = 1  # summaries and other housekeeping
+BATCH = 2  # bulk jobs such as batch evaluation
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", BATCH: "batch"}
+
+class DeadlineExceeded(Exception):
+    """A model call could not be started or finished before its deadline"""
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to a burst of per_minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken; amounts over the capacity wait for a full bucket"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+class ModelCallScheduler:
+    """
+    Admission control for model calls within one event loop:
+    - at most max_concurrency calls in flight
+    - requests/min and estimated tokens/min token buckets (0 disables a bucket)
+    - waiting calls start in priority order, then first come first served
+    - pause() holds every call back, e.g. while the provider asks us to back off
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.max_concurrency = max_concurrency
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._waiters: List[Tuple[int, int, asyncio.Future, float]] = []  # (priority, seq, future, tokens)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.counts: Counter = Counter()  # started, retries, rate_limited, deadline_exceeded...
+        self.max_queue_depth = 0
+        self.wait_seconds: Dict[int, float] = Counter()  # priority: total seconds waited
+        self.max_wait_seconds = 0.0
+
+    async def acquire(self, priority: int, tokens: float, deadline: float):
+        """Wait for a slot; deadline is in time.monotonic() seconds. Pair with release()."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, tokens))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        started = time.monotonic()
+        self._dispatch()
+        # asyncio.wait, unlike wait_for, never drops the caller's cancellation
+        # when the slot is granted in the same loop iteration
+        try:
+            done, _ = await asyncio.wait({future}, timeout=max(deadline - started, 0))
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted as the caller was cancelled: hand the slot back
+                self.release()
+            future.cancel()
+            self._dispatch()
+            raise
+        if not done:
+            future.cancel()
+            self._dispatch()
+            self.counts["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"no model call slot within {deadline - started:.1f}s")
+
+        waited = time.monotonic() - started
+        self.wait_seconds[priority] += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.counts[f"started_priority_{priority}"] += 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        """Start no call for the next `seconds`"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.counts["pauses"] += 1
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiters and self._in_flight < self.max_concurrency:
+            _, _, future, tokens = self._waiters[0]
+            if future.done():
+                # Gave up waiting
+                heapq.heappop(self._waiters)
+                continue
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now) if self._requests else 0.0,
+                self._tokens.wait_time(tokens, now) if self._tokens else 0.0
+            )
+            if wait > 0:
+                self._wake_in(wait)
+                return
+            heapq.heappop(self._waiters)
+            if self._requests:
+                self._requests.take(1, now)
+            if self._tokens:
+                self._tokens.take(tokens, now)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _wake_in(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        when = loop.time() + seconds
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            "queue_depth": sum(1 for waiter in self._waiters if not waiter[2].done()),
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+        for priority, name in PRIORITY_NAMES.items():
+            started = self.counts[f"started_priority_{priority}"]
+            stats[f"started_{name}"] = started
+            stats[f"mean_wait_seconds_{name}"] = self.wait_seconds[priority] / started if started else 0.0
+        for counter in ("retries", "rate_limited", "pauses", "deadline_exceeded", "failed"):
+            stats[counter] = self.counts[counter]
+        return stats
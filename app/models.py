@@ -0,0 +1,128 @@
+from collections import Counter, deque
+from datetime import datetime
+from itertools import islice
+from typing import Deque, List, Dict, Optional
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+from .observations import COMMENTS, Observations, to_micros
+from .review_scheduler import START_EASE, ReviewQueue, ReviewState, replay, review
+from .word_knowledge import MASTERED, NEEDS_REINFORCEMENT, Verdict
+
+# Observations remembered per user for delta responses; older versions get a full snapshot
+CHANGE_LOG_SIZE = 1000
+
+class WordHistory(BaseModel):
+    # {timestamp, comment} dicts, held as integer and interned-comment columns
+    observations: Observations = Field(default_factory=Observations)
+    last_used: Optional[str] = None
+    # Digest kept up to date as observations are added, so prompts need not replay them
+    status: Optional[str] = None  # "mastered" or "needs_reinforcement", from the latest observation
+    error_count: int = 0  # observations reporting a mistake
+    # Spaced-repetition schedule (see review_scheduler), also updated per observation
+    repetitions: int = 0
+    ease: float = START_EASE
+    interval: int = 0  # seconds
+    due: Optional[int] = None  # epoch seconds, on the same clock as the observation timestamps
+
+    @model_validator(mode="after")
+    def fill_digest(self) -> "WordHistory":
+        # Records saved before the digest or the schedule existed: rebuild them from the observations
+        if self.status is None and self.observations:
+            comment_ids = self.observations.comment_ids
+            self.status = COMMENTS.statuses[comment_ids[-1]]
+            self.error_count = sum(COMMENTS.errors[comment_id] for comment_id in comment_ids)
+        if self.due is None and self.observations:
+            verdicts = COMMENTS.verdicts
+            self.repetitions, self.ease, self.interval, self.due = replay(
+                (Verdict(verdicts[comment_id]), at)
+                for comment_id, at in zip(self.observations.comment_ids, self.observations.seconds())
+            )
+        return self
+
+    def update_digest(self, comment_id: int):
+        """Fold one new observation's comment (an id in COMMENTS) into the digest"""
+        # Plain unvalidated fields, set through __dict__: pydantic's __setattr__
+        # costs ~10us a field, several times over for every observation
+        self.__dict__.update(status=COMMENTS.statuses[comment_id],
+                             error_count=self.error_count + COMMENTS.errors[comment_id])
+
+    def update_schedule(self, comment_id: int, at: int):
+        """Reschedule the word's next review after an observation at `at` (epoch seconds)"""
+        state = ReviewState(self.repetitions, self.ease, self.interval, self.due)
+        self.__dict__.update(review(state, Verdict(COMMENTS.verdicts[comment_id]), at)._asdict())
+
+class UserProgress(BaseModel):
+    word_history: Dict[str, WordHistory] = {}  # word: WordHistory
+    role_play: Optional[str] = None
+    current_position: int = 0
+    conversation_history: List[str] = []  # recent lines only, older ones are archived
+    conversation_summary: str = ""  # rolling summary of the archived lines
+    archived_lines: int = 0  # number of lines folded into the summary and archived
+    # Aggregates of the word digests, kept up to date by add_observation
+    mastered_count: int = 0
+    reinforcement_count: int = 0
+    # Observations recorded so far; observations are append-only, so this
+    # only grows and clients can ask for what was added since a version
+    version: int = 0
+    # Word of each of the latest observations, oldest first; the last entry is `version`
+    _changes: Deque[str] = PrivateAttr(default_factory=lambda: deque(maxlen=CHANGE_LOG_SIZE))
+    # Words by due time, built on first use and kept up to date by add_observation
+    _reviews: Optional[ReviewQueue] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def fill_counts(self) -> "UserProgress":
+        # Records saved before the aggregates existed: count the word digests
+        if "mastered_count" not in self.model_fields_set:
+            statuses = [history.status for history in self.word_history.values()]
+            self.mastered_count = statuses.count(MASTERED)
+            self.reinforcement_count = statuses.count(NEEDS_REINFORCEMENT)
+        if "version" not in self.model_fields_set:
+            self.version = sum(len(history.observations) for history in self.word_history.values())
+        return self
+
+    def changes_since(self, version: int) -> Optional[Dict[str, WordHistory]]:
+        """
+        Words observed after `version`, each with its current digest and only the
+        new observations. None when the change log no longer reaches back that far
+        (or the version is unknown), so the caller sends the full word_history.
+        """
+        missing = self.version - version
+        if missing < 0 or missing > len(self._changes):
+            return None
+        counts = Counter(islice(self._changes, len(self._changes) - missing, None))
+        return {
+            word: self.word_history[word].model_copy(update={"observations": self.word_history[word].observations[-count:]})
+            for word, count in counts.items()
+        }
+
+    def words_due(self, now: int, count: int) -> List[str]:
+        """Up to count words due for review at `now` (epoch seconds), most overdue first"""
+        if self._reviews is None:
+            self._reviews = ReviewQueue(self.word_history)
+        return self._reviews.due(self.word_history, now, count)
+
+    def add_observation(self, word: str, comment: str, at: Optional[datetime] = None):
+        """Record an observation of a word (now, or at `at`), updating its digest, schedule and the mastery counts"""
+        history = self.word_history.get(word)
+        if history is None:
+            history = self.word_history[word] = WordHistory()
+        self._count(history.status, -1)
+
+        now = at or datetime.now()
+        micros = to_micros(now)
+        comment_id = COMMENTS.intern(comment)
+        history.observations.add(micros, comment_id)
+        history.__dict__["last_used"] = now.isoformat()
+        history.update_digest(comment_id)
+        due = history.due
+        history.update_schedule(comment_id, micros // 1_000_000)
+        if self._reviews is not None and history.due != due:
+            self._reviews.push(word, history.due, self.word_history)
+        self._count(history.status, 1)
+        self.__dict__["version"] += 1
+        self._changes.append(word)
+
+    def _count(self, status: Optional[str], delta: int):
+        if status == MASTERED:
+            self.__dict__["mastered_count"] += delta
+        elif status == NEEDS_REINFORCEMENT:
+            self.__dict__["reinforcement_count"] += delta
@@ -0,0 +1,221 @@
+import threading
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pydantic_core import core_schema
+
+from .word_knowledge import Verdict, classify_comment, is_error, verdict
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def to_micros(moment: datetime) -> int:
+    """Microseconds from the epoch to a naive (local wall clock) datetime"""
+    return (moment - EPOCH) // MICROSECOND
+
+def from_micros(micros: int) -> str:
+    return (EPOCH + micros * MICROSECOND).isoformat()
+
+def parse_timestamp(timestamp: str) -> Optional[int]:
+    """A stored ISO timestamp as microseconds, or None if they would not format back to the same string"""
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is not None or moment.isoformat() != timestamp:
+        return None
+    return to_micros(moment)
+
+class CommentTable:
+    """
+    Evaluator comments interned for the whole process. Observations hold a
+    comment's id; the text, its verdict and the digest classification are kept
+    once here. The evaluator repeats a small set of comments, so the table
+    stays small. Ids mean nothing outside this process, so stores keep the text
+    (or their own ids for it).
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.comments: List[str] = []
+        self.statuses: List[str] = []  # classify_comment of each comment
+        self.errors = array("B")  # is_error of each comment
+        self.verdicts = array("B")
+
+    def intern(self, comment: str) -> int:
+        comment_id = self._ids.get(comment)
+        if comment_id is None:
+            with self._lock:
+                comment_id = self._ids.get(comment)
+                if comment_id is None:
+                    comment_id = len(self.comments)
+                    self.comments.append(comment)
+                    self.statuses.append(classify_comment(comment))
+                    self.errors.append(is_error(comment))
+                    self.verdicts.append(verdict(comment))
+                    # Published last, so a reader that finds the id finds its entries
+                    self._ids[comment] = comment_id
+        return comment_id
+
+    def __len__(self) -> int:
+        return len(self.comments)
+
+COMMENTS = CommentTable()
+
+class Observations:
+    """
+    A word's observations, stored as two columns: timestamps in microseconds
+    since the epoch and interned comment ids. Reads and serializes as the
+    list of {timestamp, comment} dicts it replaces. A timestamp that does not
+    survive the round trip through an integer keeps its original string.
+    """
+
+    __slots__ = ("timestamps", "comment_ids", "_raw_timestamps")
+
+    def __init__(self, timestamps: Optional[array] = None, comment_ids: Optional[array] = None,
+                 raw_timestamps: Optional[Dict[int, str]] = None):
+        self.timestamps = array("q") if timestamps is None else timestamps
+        self.comment_ids = array("I") if comment_ids is None else comment_ids
+        self._raw_timestamps = raw_timestamps  # index: original string, only for the rare odd timestamp
+
+    @classmethod
+    def from_dicts(cls, observations: Iterable[Dict[str, str]]) -> "Observations":
+        timestamps, comment_ids, raw_timestamps = [], [], {}
+        intern = COMMENTS.intern
+        for index, observation in enumerate(observations):
+            timestamp = observation["timestamp"]
+            micros = parse_timestamp(timestamp)
+            if micros is None:
+                raw_timestamps[index] = timestamp
+                micros = 0
+            timestamps.append(micros)
+            comment_ids.append(intern(observation["comment"]))
+        return cls(array("q", timestamps), array("I", comment_ids), raw_timestamps or None)
+
+    def add(self, micros: int, comment_id: int):
+        self.timestamps.append(micros)
+        self.comment_ids.append(comment_id)
+
+    def add_stored(self, timestamp: Union[int, str], comment_id: int):
+        """Append an observation whose timestamp is either microseconds or an ISO string"""
+        if isinstance(timestamp, str):
+            micros = parse_timestamp(timestamp)
+            if micros is None:
+                if self._raw_timestamps is None:
+                    self._raw_timestamps = {}
+                self._raw_timestamps[len(self.timestamps)] = timestamp
+                micros = 0
+            timestamp = micros
+        self.add(timestamp, comment_id)
+
+    def append(self, observation: Dict[str, str]):
+        self.add_stored(observation["timestamp"], COMMENTS.intern(observation["comment"]))
+
+    def stored_timestamp(self, index: int) -> Union[int, str]:
+        """Microseconds, or the original string for a timestamp kept as written"""
+        if self._raw_timestamps is not None:
+            raw = self._raw_timestamps.get(range(len(self.timestamps))[index])
+            if raw is not None:
+                return raw
+        return self.timestamps[index]
+
+    def rows(self, start: int = 0) -> Iterator[Tuple[Union[int, str], int]]:
+        """(stored timestamp, comment id) of the observations from index start on"""
+        if self._raw_timestamps is None:
+            return zip(self.timestamps[start:], self.comment_ids[start:])
+        return ((self.stored_timestamp(i), self.comment_ids[i]) for i in range(start, len(self.timestamps)))
+
+    def seconds(self) -> Iterator[int]:
+        """Epoch seconds of each observation; a timestamp kept as text is parsed if it can be, else taken as the one before"""
+        if self._raw_timestamps is None:
+            return (micros // 1_000_000 for micros in self.timestamps)
+        return self._seconds_with_raw()
+
+    def _seconds_with_raw(self) -> Iterator[int]:
+        previous = 0
+        for index, micros in enumerate(self.timestamps):
+            raw = self._raw_timestamps.get(index)
+            if raw is not None:
+                try:
+                    moment = datetime.fromisoformat(raw)
+                    if moment.tzinfo is not None:
+                        moment = moment.astimezone().replace(tzinfo=None)
+                    micros = to_micros(moment)
+                except (TypeError, ValueError):
+                    micros = previous
+            previous = micros
+            yield micros // 1_000_000
+
+    def timestamp(self, index: int) -> str:
+        stored = self.stored_timestamp(index)
+        return stored if isinstance(stored, str) else from_micros(stored)
+
+    def comment(self, index: int) -> str:
+        return COMMENTS.comments[self.comment_ids[index]]
+
+    def verdict(self, index: int) -> Verdict:
+        return Verdict(COMMENTS.verdicts[self.comment_ids[index]])
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            raw = None
+            if self._raw_timestamps is not None:
+                positions = range(len(self.timestamps))[index]
+                raw = {new: self._raw_timestamps[old] for new, old in enumerate(positions)
+                       if old in self._raw_timestamps} or None
+            return Observations(self.timestamps[index], self.comment_ids[index], raw)
+        return {"timestamp": self.timestamp(index), "comment": self.comment(index)}
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return (self[i] for i in range(len(self.timestamps)))
+
+    def to_list(self) -> List[Dict[str, str]]:
+        comments = COMMENTS.comments
+        if self._raw_timestamps is None:
+            # from_micros inlined: this runs for every observation of a full word_history response
+            return [{"timestamp": (EPOCH + micros * MICROSECOND).isoformat(), "comment": comments[comment_id]}
+                    for micros, comment_id in zip(self.timestamps, self.comment_ids)]
+        return list(self)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Observations):
+            return (self.timestamps == other.timestamps and self.comment_ids == other.comment_ids
+                    and (self._raw_timestamps or {}) == (other._raw_timestamps or {}))
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def __copy__(self) -> "Observations":
+        return Observations(array("q", self.timestamps), array("I", self.comment_ids),
+                            dict(self._raw_timestamps) if self._raw_timestamps else None)
+
+    def __deepcopy__(self, memo) -> "Observations":
+        return self.__copy__()
+
+    def __repr__(self) -> str:
+        return f"Observations({self.to_list()!r})"
+
+    @classmethod
+    def validate(cls, value: Any) -> "Observations":
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls.from_dicts(value)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"observations must be a list of {{timestamp, comment}} objects: {e!r}") from e
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler) -> core_schema.CoreSchema:
+        # Validated in one pass by from_dicts rather than as a list of dicts first
+        return core_schema.no_info_plain_validator_function(
+            cls.validate, serialization=core_schema.plain_serializer_function_ser_schema(cls.to_list)
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema: core_schema.CoreSchema, handler) -> Dict[str, Any]:
+        return handler(core_schema.list_schema(core_schema.dict_schema(core_schema.str_schema(), core_schema.str_schema())))
@@ -0,0 +1,111 @@
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .data.data_processing import GERESH, NIQQUD
+from .sqlite_connection import ReopenableConnection
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: niqqud, punctuation, case and whitespace folded"""
+    query = NIQQUD.sub("", unicodedata.normalize("NFKC", query))
+    query = GERESH.sub("", query).casefold()
+    query = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in query)
+    return re.sub(r"\s+", " ", query).strip()
+
+class ResponseCache(ReopenableConnection):
+    """
+    TTL + LRU cache of model answers keyed by normalized query.
+    With a disk_path, entries are also kept in an SQLite file that every
+    worker process shares; the in-process layer is consulted first.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at);
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, disk_path: Optional[Path] = None,
+                 max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        super().__init__(disk_path)
+        self._disk_writes = 0
+        if self._conn is not None:
+            self._conn.executescript(self.SCHEMA)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl_seconds)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, now)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 1000 == 0:
+                    self._prune_disk(now)
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            """DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_disk_entries,)
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
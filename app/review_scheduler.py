@@ -0,0 +1,96 @@
+import heapq
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .observations import to_micros
+from .word_knowledge import Verdict
+
+if TYPE_CHECKING:
+    from .models import WordHistory
+
+# SM-2 style intervals, in seconds of the same wall clock as observation timestamps
+DAY = 24 * 3600
+FIRST_INTERVAL = DAY
+SECOND_INTERVAL = 6 * DAY
+RELEARN_INTERVAL = 10 * 60  # a missed word comes back later in the same sitting
+START_EASE = 2.5
+MIN_EASE = 1.3
+# SM-2 answer quality (0-5) of each verdict; below 3 is a lapse
+QUALITY = {Verdict.CORRECT: 5, Verdict.OTHER: 3, Verdict.ASKED: 2, Verdict.INCORRECT: 1}
+
+def now_seconds() -> int:
+    """The scheduler's clock: epoch seconds of the local wall clock, like observation timestamps"""
+    return to_micros(datetime.now()) // 1_000_000
+
+class ReviewState(NamedTuple):
+    repetitions: int = 0  # successful reviews in a row
+    ease: float = START_EASE
+    interval: int = 0  # seconds until the next review
+    due: Optional[int] = None  # epoch seconds; None until the word is first seen
+
+def review(state: ReviewState, verdict: Verdict, at: int) -> ReviewState:
+    """
+    The state after one observation at `at` (epoch seconds).
+    A lapse starts the word over at RELEARN_INTERVAL. A success before the
+    word was due (the same word twice in a turn, or again minutes later)
+    leaves it as it is, so extra practice does not push reviews out.
+    """
+    quality = QUALITY[verdict]
+    ease = round(max(MIN_EASE, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)), 2)
+    if quality < 3:
+        return ReviewState(0, ease, RELEARN_INTERVAL, at + RELEARN_INTERVAL)
+    if state.due is not None and at < state.due and state.repetitions:
+        return state
+    repetitions = state.repetitions + 1
+    if repetitions == 1:
+        interval = FIRST_INTERVAL
+    elif repetitions == 2:
+        interval = SECOND_INTERVAL
+    else:
+        interval = round(state.interval * state.ease)
+    return ReviewState(repetitions, ease, interval, at + interval)
+
+def replay(reviews: Iterable[Tuple[Verdict, int]]) -> ReviewState:
+    """State after a word's whole history of (verdict, epoch seconds) observations, oldest first"""
+    state = ReviewState()
+    for verdict, at in reviews:
+        state = review(state, verdict, at)
+    return state
+
+class ReviewQueue:
+    """
+    A user's words in a heap keyed by due time.
+    - push() is called whenever a word's due time changes; its old entry stays
+      in the heap and is dropped when it reaches the top (lazy deletion)
+    - due() returns the `count` most overdue words without a scan, in
+      O(count log n); the heap is rebuilt once stale entries outnumber words
+    """
+
+    def __init__(self, word_history: Dict[str, "WordHistory"]):
+        self._heap: List[Tuple[int, str]] = [(h.due, word) for word, h in word_history.items() if h.due is not None]
+        heapq.heapify(self._heap)
+
+    def push(self, word: str, due: int, word_history: Dict[str, "WordHistory"]):
+        heapq.heappush(self._heap, (due, word))
+        if len(self._heap) > 2 * len(word_history) + 64:
+            self.__init__(word_history)
+
+    def due(self, word_history: Dict[str, "WordHistory"], now: int, count: int) -> List[str]:
+        """Up to count words due at `now` (epoch seconds), most overdue first"""
+        heap = self._heap
+        found: Dict[str, None] = {}
+        kept = []
+        while heap and len(found) < count:
+            due, word = heapq.heappop(heap)
+            if word_history[word].due != due or word in found:
+                continue  # stale or duplicate entry: drop it
+            kept.append((due, word))
+            if due > now:
+                break
+            found[word] = None
+        for entry in kept:
+            heapq.heappush(heap, entry)
+        return list(found)
+
+    def __len__(self) -> int:
+        return len(self._heap)
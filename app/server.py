@@ -0,0 +1,181 @@
+"""
+Production server: one supervisor process imports the app, binds the
+listening socket and forks worker processes that serve it.
+
+    python -m app.server [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+Everything built at import (vocabulary indexes, prompt prefixes, pydantic
+validators, the middleware stack) is built once, in the supervisor, and
+shared copy-on-write by the workers, which start serving right after the
+fork. The supervisor:
+- closes its SQLite connections before forking; each worker opens its own.
+  SQLite connections must not cross a fork: the child would share the
+  parent's file descriptors and locks, and using them from both processes
+  can corrupt the database (see sqlite_connection.ReopenableConnection)
+- with more than one worker, makes the user store safe to share (see
+  UserStorage.share_between_processes)
+- replaces workers that die, and stops if one fails to start
+- on SIGTERM or SIGINT, passes SIGTERM to the workers and waits for them to
+  drain: readiness checks fail, in-flight requests get SERVER_GRACEFUL_TIMEOUT
+  seconds, then pending user writes are flushed. Workers still running
+  SHUTDOWN_GRACE seconds after that are killed; a second signal kills at once
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+
+from .config import Config
+from .controller import language_controller
+from .storage import UserStorage
+
+# uvicorn's logger, so supervisor messages come out configured like the workers'
+logger = logging.getLogger("uvicorn.error")
+
+STARTUP_FAILURE = 3  # worker exit status when the app's startup fails, as in uvicorn
+SHUTDOWN_GRACE = 15  # seconds for the app's shutdown after requests have drained
+RESPAWN_DELAY = 1.0  # seconds before replacing a worker that died right after starting
+POLL_INTERVAL = 0.1
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn's server, failing readiness checks as soon as a shutdown signal arrives"""
+
+    def handle_exit(self, sig, frame):
+        language_controller.begin_drain()
+        super().handle_exit(sig, frame)
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.socket: Optional[socket.socket] = None
+        self.children: Dict[int, float] = {}  # pid: monotonic start time
+        self.stopping = False
+        self.killing = False
+
+    def run(self) -> int:
+        if self.workers > 1:
+            UserStorage.share_between_processes(Path(Config.USER_DB_PATH).with_suffix(".locks"))
+        self.config.load()
+        language_controller.preload()
+        self.socket = self.config.bind_socket()
+        language_controller.close_connections()
+        # Keep the preloaded objects out of the collector's reach, so collections
+        # in the workers don't touch (and copy) the pages they share
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        logger.info("Supervisor %d starting %d workers", os.getpid(), self.workers)
+        for _ in range(self.workers):
+            self._spawn()
+
+        status = 0
+        while self.children and not self.stopping:
+            for pid, code in self._reap():
+                if code == STARTUP_FAILURE:
+                    logger.error("Worker %d failed to start, stopping", pid)
+                    self.stopping = True
+                    status = STARTUP_FAILURE
+                    break
+                logger.warning("Worker %d exited with status %d, replacing it", pid, code)
+                self._spawn()
+            time.sleep(POLL_INTERVAL)
+        self._stop()
+        self.socket.close()
+        return status
+
+    def _handle_signal(self, sig, frame):
+        if self.stopping:
+            self.killing = True
+        self.stopping = True
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        # Worker: never returns into the supervisor's code
+        status = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            language_controller.reopen_connections()
+            server = WorkerServer(self.config)
+            server.run(sockets=[self.socket])
+            status = 0 if server.started else STARTUP_FAILURE
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            # What the atexit hook would do, as os._exit skips it
+            if UserStorage.cache is not None:
+                UserStorage.cache.flush()
+        finally:
+            logging.shutdown()
+            os._exit(status)
+
+    def _reap(self) -> List[Tuple[int, int]]:
+        """(pid, exit status) of the workers that have exited, waiting before a respawn if one died young"""
+        exited = []
+        while self.children:
+            pid, wait_status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            exited.append((pid, os.waitstatus_to_exitcode(wait_status)))
+            if not self.stopping and time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+        return exited
+
+    def _stop(self):
+        logger.info("Supervisor stopping %d workers", len(self.children))
+        self._signal_children(signal.SIGTERM)
+        deadline = time.monotonic() + self.config.timeout_graceful_shutdown + SHUTDOWN_GRACE
+        while self.children and not self.killing and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(POLL_INTERVAL)
+        if self.children:
+            logger.warning("Killing %d workers (%s)", len(self.children),
+                           "second signal" if self.killing else "did not stop in time")
+            self._signal_children(signal.SIGKILL)
+            for pid in list(self.children):
+                os.waitpid(pid, 0)
+                del self.children[pid]
+
+    def _signal_children(self, sig: int):
+        for pid in self.children:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app from forked worker processes")
+    parser.add_argument("--host", default=Config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument("--graceful-timeout", type=int, default=Config.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers > 1 and Config.USER_STORE == "json":
+        parser.error("the JSON user store cannot be shared between workers; use USER_STORE=sqlite or --workers 1")
+
+    config = uvicorn.Config(
+        language_controller.app,
+        host=args.host,
+        port=args.port,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level
+    )
+    raise SystemExit(Supervisor(config, max(args.workers, 1)).run())
+
+if __name__ == "__main__":
+    main()
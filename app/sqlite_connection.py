@@ -0,0 +1,32 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+class ReopenableConnection:
+    """
+    Base for objects keeping one SQLite connection (WAL, autocommit) in _conn,
+    used from several threads under _lock. close() and reopen() bracket a fork,
+    see app.server. Without a path no connection is opened and both do nothing.
+    """
+
+    def __init__(self, db_path: Optional[Path]):
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = self._connect() if db_path is not None else None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+
+    def reopen(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn = self._connect()
@@ -0,0 +1,576 @@
+import asyncio
+import atexit
+import json
+import os
+import tempfile
+import zlib
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+from weakref import WeakValueDictionary
+
+from .config import Config
+from .models import UserProgress, WordHistory
+from .observations import COMMENTS, Observations, parse_timestamp
+from .sqlite_connection import ReopenableConnection
+from .tracing import span
+from .user_cache import UserProgressCache
+
+DATA_DIR = Path(Config.USER_DATA_DIR)
+DATA_DIR.mkdir(exist_ok=True)
+
+def stored_timestamp(timestamp: str):
+    """An observation timestamp as word_observations stores it: microseconds when exact, else the text"""
+    micros = parse_timestamp(timestamp)
+    return timestamp if micros is None else micros
+
+class JSONUserStore:
+    """One JSON document per user, rewritten in full on every save"""
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+
+    def get_user_file_path(self, username: str) -> Path:
+        return self.data_dir / f"{username}.json"
+
+    def exists(self, username: str) -> bool:
+        return self.get_user_file_path(username).exists()
+
+    def close(self):
+        """Nothing is held open: every call opens its own file"""
+
+    def reopen(self):
+        pass
+
+    def save(self, username: str, progress: UserProgress):
+        # Write to a temporary file and rename it over the old one so a crash
+        # mid-write never leaves a truncated document behind
+        file_path = self.get_user_file_path(username)
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=f".{file_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(progress.model_dump(), f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, username: str) -> Optional[UserProgress]:
+        file_path = self.get_user_file_path(username)
+        if not file_path.exists():
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return UserProgress(**data)
+
+    def archive_conversation(self, username: str, lines: List[str], first_seq: int):
+        """Append conversation lines leaving the hot record to <username>.archive.jsonl"""
+        archive_path = self.data_dir / f"{username}.archive.jsonl"
+        with open(archive_path, 'a', encoding='utf-8') as f:
+            for i, line in enumerate(lines):
+                f.write(json.dumps({"seq": first_seq + i, "line": line}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class SQLiteUserStore(ReopenableConnection):
+    """
+    Users in an embedded SQLite database (WAL mode).
+    Observations and conversation lines are append-only rows, so a save only
+    inserts what was added since the last save, inside a single transaction.
+    Observation comments are stored once in the comments table and referenced by id.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        role_play TEXT,
+        current_position INTEGER NOT NULL DEFAULT 0,
+        conversation_count INTEGER NOT NULL DEFAULT 0,
+        archived_lines INTEGER NOT NULL DEFAULT 0,
+        conversation_summary TEXT NOT NULL DEFAULT '',
+        mastered_count INTEGER,
+        reinforcement_count INTEGER,
+        revision INTEGER NOT NULL DEFAULT 0  -- bumped by every save
+    );
+    CREATE TABLE IF NOT EXISTS words (
+        username TEXT NOT NULL,
+        word TEXT NOT NULL,
+        last_used TEXT,
+        observation_count INTEGER NOT NULL DEFAULT 0,
+        status TEXT,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        repetitions INTEGER NOT NULL DEFAULT 0,
+        ease REAL,
+        interval INTEGER NOT NULL DEFAULT 0,
+        due INTEGER,
+        PRIMARY KEY (username, word)
+    );
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY,
+        comment TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS word_observations (
+        username TEXT NOT NULL,
+        word TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,  -- microseconds since the epoch, or the text of an irregular timestamp
+        comment_id INTEGER NOT NULL REFERENCES comments (id),
+        PRIMARY KEY (username, word, seq)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS conversation (
+        username TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        line TEXT NOT NULL,
+        PRIMARY KEY (username, seq)
+    );
+    """
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        self._conn.executescript(self.SCHEMA)
+        self._add_missing_columns()
+        # comments.id <-> COMMENTS id, filled as comments are saved and loaded
+        self._comment_ids: Dict[int, int] = {}
+        self._local_comment_ids: Dict[int, int] = {}
+        self._migrate_observations()
+
+    def _add_missing_columns(self):
+        # Databases created before conversation archiving and word digests lack
+        # these columns; NULL digests and counts are rebuilt when a user is loaded
+        for table, column, definition in (
+            ("users", "archived_lines", "INTEGER NOT NULL DEFAULT 0"),
+            ("users", "conversation_summary", "TEXT NOT NULL DEFAULT ''"),
+            ("users", "mastered_count", "INTEGER"),
+            ("users", "reinforcement_count", "INTEGER"),
+            ("users", "revision", "INTEGER NOT NULL DEFAULT 0"),
+            ("words", "status", "TEXT"),
+            ("words", "error_count", "INTEGER NOT NULL DEFAULT 0"),
+            ("words", "repetitions", "INTEGER NOT NULL DEFAULT 0"),
+            ("words", "ease", "REAL"),
+            ("words", "interval", "INTEGER NOT NULL DEFAULT 0"),
+            ("words", "due", "INTEGER"),
+        ):
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _migrate_observations(self):
+        # Databases from before comments were interned keep observations as text
+        # rows; move them to word_observations once, in one transaction
+        conn = self._conn
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'observations'").fetchone():
+                    conn.create_function("stored_timestamp", 1, stored_timestamp, deterministic=True)
+                    conn.execute("INSERT OR IGNORE INTO comments (comment) SELECT DISTINCT comment FROM observations")
+                    conn.execute(
+                        """INSERT OR IGNORE INTO word_observations (username, word, seq, timestamp, comment_id)
+                        SELECT o.username, o.word, o.seq, stored_timestamp(o.timestamp), c.id
+                        FROM observations o JOIN comments c ON c.comment = o.comment"""
+                    )
+                    conn.execute("DROP TABLE observations")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _stored_comment_id(self, comment_id: int, new_ids: Dict[int, int]) -> int:
+        """comments.id of a COMMENTS id, inserting the comment if it is new; new mappings go to new_ids"""
+        stored = self._comment_ids.get(comment_id)
+        if stored is None:
+            stored = new_ids.get(comment_id)
+        if stored is None:
+            comment = COMMENTS.comments[comment_id]
+            self._conn.execute("INSERT OR IGNORE INTO comments (comment) VALUES (?)", (comment,))
+            (stored,) = self._conn.execute("SELECT id FROM comments WHERE comment = ?", (comment,)).fetchone()
+            new_ids[comment_id] = stored
+        return stored
+
+    def _local_comment_id(self, stored: int) -> int:
+        comment_id = self._local_comment_ids.get(stored)
+        if comment_id is None:
+            (comment,) = self._conn.execute("SELECT comment FROM comments WHERE id = ?", (stored,)).fetchone()
+            comment_id = COMMENTS.intern(comment)
+            self._local_comment_ids[stored] = comment_id
+            self._comment_ids[comment_id] = stored
+        return comment_id
+
+    def exists(self, username: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM users WHERE username = ?", (username,)
+            ).fetchone() is not None
+
+    def delete(self, username: str):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("word_observations", "words", "conversation", "users"):
+                    conn.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def revision(self, username: str) -> Optional[int]:
+        """How many times the user has been saved, None if never; tells a process whether another one saved it since"""
+        with self._lock:
+            row = self._conn.execute("SELECT revision FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, username: str, progress: UserProgress) -> int:
+        """Write what changed since the user's last save; returns the user's new revision"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Lines stored so far, counting any archive_conversation() wrote
+                # ahead of the save that records the new archived_lines
+                (stored_lines,) = conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM conversation WHERE username = ?", (username,)
+                ).fetchone()
+                stored_counts: Dict[str, int] = dict(conn.execute(
+                    "SELECT word, observation_count FROM words WHERE username = ?", (username,)
+                ))
+
+                new_comment_ids: Dict[int, int] = {}
+                for word, history in progress.word_history.items():
+                    stored = stored_counts.get(word)
+                    if stored is not None and len(history.observations) <= stored:
+                        continue
+                    new_observations = history.observations.rows(stored or 0)
+                    conn.executemany(
+                        "INSERT INTO word_observations (username, word, seq, timestamp, comment_id) VALUES (?, ?, ?, ?, ?)",
+                        [(username, word, (stored or 0) + i, timestamp, self._stored_comment_id(comment_id, new_comment_ids))
+                         for i, (timestamp, comment_id) in enumerate(new_observations)]
+                    )
+                    conn.execute(
+                        """INSERT INTO words (username, word, last_used, observation_count, status, error_count,
+                                              repetitions, ease, interval, due)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (username, word) DO UPDATE SET
+                            last_used = excluded.last_used,
+                            observation_count = excluded.observation_count,
+                            status = excluded.status,
+                            error_count = excluded.error_count,
+                            repetitions = excluded.repetitions,
+                            ease = excluded.ease,
+                            interval = excluded.interval,
+                            due = excluded.due""",
+                        (username, word, history.last_used, len(history.observations), history.status,
+                         history.error_count, history.repetitions, history.ease, history.interval, history.due)
+                    )
+
+                # Line i of the hot history is line archived_lines + i of the whole conversation
+                first_new = max(stored_lines - progress.archived_lines, 0)
+                new_lines = progress.conversation_history[first_new:]
+                conn.executemany(
+                    "INSERT INTO conversation (username, seq, line) VALUES (?, ?, ?)",
+                    [(username, progress.archived_lines + first_new + i, line) for i, line in enumerate(new_lines)]
+                )
+                conn.execute(
+                    """INSERT INTO users (username, role_play, current_position, conversation_count,
+                                          archived_lines, conversation_summary, mastered_count,
+                                          reinforcement_count, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+                    ON CONFLICT (username) DO UPDATE SET
+                        revision = revision + 1,
+                        role_play = excluded.role_play,
+                        current_position = excluded.current_position,
+                        conversation_count = excluded.conversation_count,
+                        archived_lines = excluded.archived_lines,
+                        conversation_summary = excluded.conversation_summary,
+                        mastered_count = excluded.mastered_count,
+                        reinforcement_count = excluded.reinforcement_count""",
+                    (username, progress.role_play, progress.current_position,
+                     max(stored_lines, progress.archived_lines + len(progress.conversation_history)),
+                     progress.archived_lines, progress.conversation_summary,
+                     progress.mastered_count, progress.reinforcement_count)
+                )
+                (revision,) = conn.execute("SELECT revision FROM users WHERE username = ?", (username,)).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            # Only now that the comments rows are committed
+            for comment_id, stored in new_comment_ids.items():
+                self._comment_ids[comment_id] = stored
+                self._local_comment_ids[stored] = comment_id
+        return revision
+
+    def load(self, username: str) -> Optional[UserProgress]:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                user = conn.execute(
+                    """SELECT role_play, current_position, archived_lines, conversation_summary,
+                              mastered_count, reinforcement_count
+                    FROM users WHERE username = ?""", (username,)
+                ).fetchone()
+                if user is None:
+                    return None
+
+                words = {row[0]: row[1:] for row in conn.execute(
+                    """SELECT word, last_used, status, error_count, repetitions, ease, interval, due
+                    FROM words WHERE username = ? ORDER BY rowid""",
+                    (username,)
+                )}
+                observations = {word: Observations() for word in words}
+                local_ids = self._local_comment_ids
+                for word, timestamp, stored in conn.execute(
+                    "SELECT word, timestamp, comment_id FROM word_observations WHERE username = ? ORDER BY word, seq",
+                    (username,)
+                ):
+                    comment_id = local_ids.get(stored)
+                    if comment_id is None:
+                        comment_id = self._local_comment_id(stored)
+                    observations[word].add_stored(timestamp, comment_id)
+                # Rows written before the digest or the schedule were stored have no
+                # status or due time; built with their observations, WordHistory
+                # derives them from those
+                word_history = {}
+                for word, (last_used, status, error_count, repetitions, ease, interval, due) in words.items():
+                    schedule = {"repetitions": repetitions, "ease": ease, "interval": interval, "due": due} \
+                        if due is not None else {}
+                    word_history[word] = WordHistory(
+                        observations=observations[word], last_used=last_used, status=status,
+                        error_count=error_count if status is not None else 0, **schedule
+                    )
+
+                # Archived lines stay in the table but are not part of the hot record
+                conversation_history = [line for (line,) in conn.execute(
+                    "SELECT line FROM conversation WHERE username = ? AND seq >= ? ORDER BY seq",
+                    (username, user[2])
+                )]
+            finally:
+                conn.execute("COMMIT")
+
+        counts = {}
+        if user[4] is not None:
+            counts = {"mastered_count": user[4], "reinforcement_count": user[5]}
+        return UserProgress(
+            word_history=word_history,
+            role_play=user[0],
+            current_position=user[1],
+            conversation_history=conversation_history,
+            conversation_summary=user[3],
+            archived_lines=user[2],
+            **counts
+        )
+
+    def archive_conversation(self, username: str, lines: List[str], first_seq: int):
+        """Make sure lines leaving the hot record are stored; load() skips them once archived_lines is saved"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO conversation (username, seq, line) VALUES (?, ?, ?)",
+                    [(username, first_seq + i, line) for i, line in enumerate(lines)]
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+class ProcessUserLocks:
+    """
+    Per-user locks between the worker processes of one server, as POSIX
+    byte-range locks on a shared lock file: one byte per slot, a slot per
+    crc32 of the username. A process's own locks on a range never block it,
+    so the locks it holds are counted per slot; users of one process are
+    already serialized by UserStorage's asyncio locks. Taking a lock polls
+    with a short backoff rather than blocking the event loop.
+    """
+
+    SLOTS = 1 << 16
+    MAX_DELAY = 0.05  # seconds between attempts on a contended lock
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._held: Dict[int, int] = {}  # slot: holders in this process
+
+    def _file(self) -> int:
+        # Opened per process: byte-range locks are not inherited across fork
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._held = {}
+        return self._fd
+
+    @asynccontextmanager
+    async def hold(self, username: str) -> AsyncIterator[None]:
+        import fcntl  # POSIX only, like the forking server that needs these locks
+
+        fd = self._file()
+        slot = zlib.crc32(username.encode("utf-8")) % self.SLOTS
+        if not self._held.get(slot):
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                    break
+                except (BlockingIOError, PermissionError):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.MAX_DELAY)
+                    if self._held.get(slot):
+                        break  # another task of this process got it meanwhile
+        self._held[slot] = self._held.get(slot, 0) + 1
+        try:
+            yield
+        finally:
+            self._held[slot] -= 1
+            if not self._held[slot]:
+                del self._held[slot]
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+
+def create_store():
+    if Config.USER_STORE == "json":
+        return JSONUserStore(DATA_DIR)
+    return SQLiteUserStore(Path(Config.USER_DB_PATH))
+
+def create_cache(store) -> Optional[UserProgressCache]:
+    if not Config.USER_CACHE_ENABLED:
+        return None
+    cache = UserProgressCache(
+        store,
+        max_users=Config.USER_CACHE_MAX_USERS,
+        max_bytes=Config.USER_CACHE_MAX_BYTES,
+        idle_seconds=Config.USER_CACHE_IDLE_SECONDS,
+        flush_interval=Config.USER_CACHE_FLUSH_INTERVAL
+    )
+    # Last resort for processes that exit without the app's shutdown event
+    atexit.register(cache.flush)
+    return cache
+
+class UserStorage:
+    store = create_store()
+    legacy_store = JSONUserStore(DATA_DIR)
+    cache = create_cache(store)
+    _locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+    # Set by share_between_processes() when several worker processes use the store
+    process_locks: Optional[ProcessUserLocks] = None
+
+    @staticmethod
+    def share_between_processes(lock_path: Path):
+        """
+        Make the store safe to use from several worker processes (SQLite store only):
+        - transactions also hold the user's lock across processes
+        - saves are written through to the store before the lock is released,
+          instead of behind, so the next process to take it sees them
+        - a cached user is only used while the store's revision of it is
+          still the one it was loaded or saved at
+        """
+        if not isinstance(UserStorage.store, SQLiteUserStore):
+            raise RuntimeError("Only the SQLite user store can be shared between worker processes")
+        UserStorage.process_locks = ProcessUserLocks(lock_path)
+
+    @staticmethod
+    def close_connections():
+        """Close the store's connection before forking workers; each reopens its own with reopen_connections()"""
+        UserStorage.store.close()
+
+    @staticmethod
+    def reopen_connections():
+        UserStorage.store.reopen()
+
+    @staticmethod
+    def get_user_file_path(username: str) -> Path:
+        return UserStorage.legacy_store.get_user_file_path(username)
+
+    @staticmethod
+    def save_user_data(username: str, progress: UserProgress):
+        with span("save_user"):
+            if UserStorage.process_locks is not None:
+                revision = UserStorage.store.save(username, progress)
+                if UserStorage.cache is not None:
+                    UserStorage.cache.put(username, progress, dirty=False, revision=revision)
+            elif UserStorage.cache is not None:
+                UserStorage.cache.put(username, progress, dirty=True)
+            else:
+                UserStorage.store.save(username, progress)
+
+    @staticmethod
+    def load_user_data(username: str) -> UserProgress:
+        with span("load_user"):
+            return UserStorage._load_user_data(username)
+
+    @staticmethod
+    def _load_user_data(username: str) -> UserProgress:
+        revision = None
+        if UserStorage.process_locks is not None:
+            # Read before loading: a save by another process in between only
+            # makes the cached copy look older than it is, never newer
+            revision = UserStorage.store.revision(username)
+        if UserStorage.cache is not None and (revision is not None or UserStorage.process_locks is None):
+            progress = UserStorage.cache.get(username, revision)
+            if progress is not None:
+                return progress
+
+        progress = UserStorage.store.load(username)
+        if progress is None:
+            # Users from before the SQLite store are imported on first access
+            progress = UserStorage.legacy_store.load(username)
+            if progress is None:
+                return UserProgress()
+            revision = UserStorage.store.save(username, progress)
+
+        if UserStorage.cache is not None:
+            UserStorage.cache.put(username, progress, dirty=False, revision=revision)
+        return progress
+
+    @staticmethod
+    def archive_conversation(username: str, lines: List[str], first_seq: int):
+        UserStorage.store.archive_conversation(username, lines, first_seq)
+
+    @staticmethod
+    def user_lock(username: str) -> asyncio.Lock:
+        lock = UserStorage._locks.get(username)
+        if lock is None:
+            lock = asyncio.Lock()
+            UserStorage._locks[username] = lock
+        return lock
+
+    @staticmethod
+    @asynccontextmanager
+    async def transaction(username: str) -> AsyncIterator[UserProgress]:
+        """
+        Load a user's latest progress, let the caller modify it and save it,
+        serialized with every other transaction for the same user. Keep slow
+        work such as model calls outside the block so other requests for the
+        same user are not held up.
+        """
+        process_lock = UserStorage.process_locks.hold(username) if UserStorage.process_locks else nullcontext()
+        async with UserStorage.user_lock(username), process_lock:
+            progress = UserStorage.load_user_data(username)
+            yield progress
+            UserStorage.save_user_data(username, progress)
+
+    @staticmethod
+    async def persist(username: str):
+        """Write the user's cached changes to the store now instead of at the next flush"""
+        if UserStorage.cache is not None:
+            await UserStorage.cache.flush_async([username])
+
+    @staticmethod
+    def pin(username: str):
+        """Keep the user's progress in memory, e.g. for the length of a session"""
+        if UserStorage.cache is not None:
+            UserStorage.cache.pin(username)
+
+    @staticmethod
+    def unpin(username: str):
+        if UserStorage.cache is not None:
+            UserStorage.cache.unpin(username)
+
+    @staticmethod
+    async def close():
+        """Write back everything still pending in the cache"""
+        if UserStorage.cache is not None:
+            await UserStorage.cache.close()
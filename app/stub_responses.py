@@ -0,0 +1,39 @@
+"""
+Canned model answers for offline load tests, shared by the in-process stub
+backend and the benchmarks' HTTP stub server. Imports nothing from the app,
+so it can be loaded before Config reads the environment.
+"""
+import json
+import re
+from typing import Dict, List
+
+REPLY = "שלום! מה שלומך היום? אני שמח לדבר איתך על הקולנוע."
+EVALUATION = "שלום: perfect usage in context\nמה: asked about meaning, needs reinforcement"
+EVALUATION_JSON = json.dumps({"observations": [
+    {"word": "שלום", "comment": "perfect usage in context"},
+    {"word": "מה", "comment": "asked about meaning, needs reinforcement"},
+]}, ensure_ascii=False)
+BATCH_INDEX = re.compile(r"^\[(\d+)\]", re.MULTILINE)
+
+def batch_evaluation_json(indices: List[str]) -> str:
+    return json.dumps({"messages": [
+        {"index": int(index), "observations": json.loads(EVALUATION_JSON)["observations"]} for index in indices
+    ]}, ensure_ascii=False)
+
+def stub_completion(messages: List[Dict[str, str]], json_output: bool = False) -> str:
+    """
+    Canned answer shaped like what the prompt asks for: observations for
+    evaluation prompts (one entry per [n] line for batch prompts), a short
+    Hebrew reply for everything else
+    """
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    if "evaluat" not in system.lower():
+        return REPLY
+    batch = BATCH_INDEX.findall(user)
+    if batch:
+        return batch_evaluation_json(batch)
+    return EVALUATION_JSON if json_output else EVALUATION
+
+def split_tokens(content: str) -> List[str]:
+    return re.findall(r"\S+\s*", content) or [content]
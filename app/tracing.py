@@ -0,0 +1,169 @@
+"""
+Request tracing and Prometheus-style metrics without extra dependencies.
+- span(phase, site) times a block into the phase histogram and the current request's trace
+- TracingMiddleware times every request into the request histogram and logs slow requests phase by phase
+- render_metrics() writes every histogram and counter in the Prometheus text format
+When tracing is disabled, span() hands back a shared no-op and the middleware passes requests straight through.
+"""
+import bisect
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+enabled = True  # set from Config.TRACING_ENABLED by the app
+slow_request_seconds = 5.0  # requests slower than this are logged with their spans
+
+# Seconds; model calls routinely take several
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed tuple of label names"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels: [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket"
+                             f"{format_labels(self.labelnames + ('le',), labels + (f'{bound:g}',))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labelnames + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+PHASE_SECONDS = Histogram("app_phase_seconds", "Time spent in each phase of a request", ("phase", "site"))
+REQUEST_SECONDS = Histogram("app_request_seconds", "Request latency until the last body byte",
+                            ("method", "endpoint", "status"))
+
+# (name, type, help, collect) where collect returns [(labels dict, value)]; read when /metrics is scraped
+_collectors: List[Tuple[str, str, str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = []
+
+def register_collector(name: str, metric_type: str, documentation: str,
+                       collect: Callable[[], List[Tuple[Dict[str, str], float]]]):
+    _collectors.append((name, metric_type, documentation, collect))
+
+def render_metrics() -> str:
+    lines = PHASE_SECONDS.render() + REQUEST_SECONDS.render()
+    for name, metric_type, documentation, collect in _collectors:
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+        for labels, value in collect():
+            lines.append(f"{name}{format_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+class Span:
+    __slots__ = ("phase", "site", "attributes", "started", "duration", "_parent")
+
+    def __init__(self, phase: str, site: str):
+        self.phase = phase
+        self.site = site
+        self.attributes: Dict[str, int] = {}
+        self.started = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        self._parent = _current_span.get()
+        _current_span.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        # set rather than reset: a streaming generator may be closed from another context
+        _current_span.set(self._parent)
+        PHASE_SECONDS.observe(self.duration, self.phase, self.site)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append(self)
+
+    def describe(self) -> str:
+        name = f"{self.phase}[{self.site}]" if self.site else self.phase
+        extra = "".join(f" {key}={value}" for key, value in self.attributes.items())
+        return f"{name} {self.duration * 1000:.1f}ms{extra}"
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+NO_SPAN = _NoSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Spans finished during the current request; tasks started by the request share the list
+_trace: ContextVar[Optional[List[Span]]] = ContextVar("trace", default=None)
+
+def span(phase: str, site: str = ""):
+    """Time a block as one phase of the current request; site tells model call sites apart"""
+    return Span(phase, site) if enabled else NO_SPAN
+
+def annotate(**attributes: int):
+    """Add counts such as prompt_tokens to the innermost open span"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+class TracingMiddleware:
+    """ASGI middleware: request latency by route template, and a phase breakdown of slow requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        trace: List[Span] = []
+        token = _trace.set(trace)
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _trace.reset(token)
+            elapsed = time.perf_counter() - started
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, scope["method"], endpoint, str(status))
+            if elapsed >= slow_request_seconds:
+                logger.warning("Slow request %s %s took %.2fs: %s", scope["method"], endpoint, elapsed,
+                               ", ".join(span.describe() for span in trace) or "no spans")
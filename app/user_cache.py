@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import UserProgress
+
+logger = logging.getLogger(__name__)
+
+# Rough per-item costs used to keep the cache under its memory budget; an
+# observation is two array slots, its comment text is shared (see observations.py)
+OBSERVATION_BYTES = 12
+WORD_BYTES = 1500
+LINE_OVERHEAD_BYTES = 100
+
+def estimate_size(progress: UserProgress) -> int:
+    """Approximate memory held by a UserProgress and its nested models"""
+    size = 1000
+    for history in progress.word_history.values():
+        size += WORD_BYTES + OBSERVATION_BYTES * len(history.observations)
+    for line in progress.conversation_history:
+        size += LINE_OVERHEAD_BYTES + 2 * len(line)
+    return size
+
+class _Entry:
+    __slots__ = ("progress", "size", "last_access", "generation", "revision")
+
+    def __init__(self, progress: UserProgress, generation: int, revision: Optional[int]):
+        self.progress = progress
+        self.size = estimate_size(progress)
+        self.last_access = time.monotonic()
+        self.generation = generation
+        self.revision = revision  # the store's revision of the user, when the store is shared
+
+class UserProgressCache:
+    """
+    LRU cache of active users' UserProgress with write-behind persistence.
+    - put(dirty=True) only marks the user dirty; a background flusher writes
+      dirty users to the store every flush_interval seconds and on shutdown
+    - entries are evicted least recently used first when the cache exceeds
+      max_users or max_bytes, and after idle_seconds without access
+    - dirty entries are written before they are evicted; with an event loop the
+      write runs in a worker thread and the entry stays readable until it is done
+    - pinned users (e.g. with an open session) are never evicted
+    - when other processes write the same store, entries carry the store
+      revision they were read or written at, and get() skips stale ones
+    """
+
+    def __init__(self, store, max_users: int, max_bytes: int, idle_seconds: float, flush_interval: float):
+        self.store = store
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Dict[str, None] = {}
+        self._bytes = 0
+        self._generations = itertools.count(1)
+        self._written: Dict[str, int] = {}  # username: generation last written to the store
+        self._pins: Dict[str, int] = {}  # username: open pins
+        self._evicting: Set[str] = set()  # dirty users being written before their eviction
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed_loop: Optional[asyncio.AbstractEventLoop] = None  # loop close() ran on
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.users_flushed = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def get(self, username: str, revision: Optional[int] = None) -> Optional[UserProgress]:
+        """The cached progress, or None; with a revision, only if the entry is at that store revision"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or (revision is not None and entry.revision != revision):
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(username)
+            return entry.progress
+
+    def put(self, username: str, progress: UserProgress, dirty: bool = True, revision: Optional[int] = None):
+        with self._lock:
+            old = self._entries.pop(username, None)
+            if old is not None:
+                self._bytes -= old.size
+            entry = _Entry(progress, next(self._generations) if dirty else 0, revision)
+            self._entries[username] = entry
+            self._bytes += entry.size
+            if dirty:
+                self._dirty[username] = None
+            self._evict_over_budget()
+        if dirty:
+            self._ensure_flusher()
+
+    def pin(self, username: str):
+        """Keep the user resident until a matching unpin()"""
+        with self._lock:
+            self._pins[username] = self._pins.get(username, 0) + 1
+
+    def unpin(self, username: str):
+        with self._lock:
+            if self._pins.get(username, 0) <= 1:
+                self._pins.pop(username, None)
+            else:
+                self._pins[username] -= 1
+
+    def _evict_over_budget(self):
+        loop = self._running_loop()
+        # Users already being written count as gone
+        users = len(self._entries) - len(self._evicting)
+        size = self._bytes - sum(self._entries[name].size for name in self._evicting)
+        to_write = []
+        for username in list(self._entries):
+            if users <= self.max_users and size <= self.max_bytes:
+                break
+            if username in self._pins or username in self._evicting:
+                continue
+            if users == 1 and username not in self._dirty:
+                # A single oversized user still stays resident while active
+                break
+            entry = self._entries[username]
+            if username in self._dirty and loop is not None:
+                # Not on the event loop: written in a thread, then evicted
+                to_write.append(username)
+            elif not self._evict(username):
+                break
+            users -= 1
+            size -= entry.size
+        if to_write:
+            self._evicting.update(to_write)
+            task = loop.create_task(self._write_and_evict(to_write))
+            task.add_done_callback(lambda _: self._evicting.difference_update(to_write))
+
+    async def _write_and_evict(self, usernames: List[str]):
+        await self.flush_async(usernames)
+        with self._lock:
+            self._evicting.difference_update(usernames)
+            # Users dirty again (written to since, or the write failed) wait for the next round
+            if not any(name in self._dirty for name in usernames):
+                self._evict_over_budget()
+
+    def _evict(self, username: str) -> bool:
+        entry = self._entries[username]
+        if username in self._dirty:
+            del self._dirty[username]
+            self._write([(username, entry.generation, entry.progress)])
+            if username in self._dirty:
+                # The write failed; keep the user resident rather than lose it
+                return False
+        del self._entries[username]
+        self._bytes -= entry.size
+        self.evictions += 1
+        return True
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            # Dirty idle users go once the next flush has written them
+            idle = [name for name, entry in self._entries.items()
+                    if entry.last_access < cutoff and name not in self._pins
+                    and name not in self._dirty and name not in self._evicting]
+            for username in idle:
+                self._evict(username)
+            # Only called between flushes, so no older snapshot can still be in flight
+            for username in [name for name in self._written if name not in self._entries]:
+                del self._written[username]
+
+    def _take_dirty(self, usernames: Optional[List[str]] = None) -> List[Tuple[str, int, UserProgress]]:
+        # Deep copies, taken on the caller's thread, so handlers can keep
+        # mutating the cached objects while the snapshot is written
+        with self._lock:
+            names = list(self._dirty) if usernames is None else [name for name in usernames if name in self._dirty]
+            snapshot = [(name, self._entries[name].generation, self._entries[name].progress.model_copy(deep=True))
+                        for name in names if name in self._entries]
+            for name in names:
+                del self._dirty[name]
+            return snapshot
+
+    def _write(self, snapshot: List[Tuple[str, int, UserProgress]]):
+        started = time.perf_counter()
+        failed = []
+        with self._write_lock:
+            for username, generation, progress in snapshot:
+                # An eviction may already have written a newer state of this user
+                if self._written.get(username, 0) >= generation:
+                    continue
+                try:
+                    self.store.save(username, progress)
+                    self._written[username] = generation
+                    self.users_flushed += 1
+                except Exception:
+                    self.flush_errors += 1
+                    logger.exception("Failed to flush user %s, will retry", username)
+                    failed.append(username)
+        if failed:
+            with self._lock:
+                for username in failed:
+                    if username in self._entries:
+                        self._dirty[username] = None
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def flush(self):
+        """Write every dirty user now, on the calling thread"""
+        snapshot = self._take_dirty()
+        if snapshot:
+            self._write(snapshot)
+
+    async def flush_async(self, usernames: Optional[List[str]] = None):
+        """Write the dirty users among usernames (all dirty users by default) in a worker thread"""
+        snapshot = self._take_dirty(usernames)
+        if snapshot:
+            await asyncio.to_thread(self._write, snapshot)
+
+    def _running_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """The loop to write in the background on; None without one or once closed on it"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return None if loop is self._closed_loop else loop
+
+    def _ensure_flusher(self):
+        loop = self._running_loop()
+        if loop is None:
+            # No event loop (scripts, migrations), or shutting down: write through
+            self.flush()
+            return
+        if self._flusher is not None and not self._flusher.done() and self._flusher.get_loop() is loop:
+            return
+        self._flusher = loop.create_task(self._run_flusher())
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_async()
+                self.evict_idle()
+            except Exception:
+                logger.exception("User cache flush failed")
+
+    async def close(self):
+        """Stop the flusher for good on this loop and write everything that is still dirty"""
+        self._closed_loop = asyncio.get_running_loop()
+        if self._flusher is not None and self._flusher.get_loop() is asyncio.get_running_loop():
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "dirty_users": len(self._dirty),
+                "pinned_users": len(self._pins),
+                "estimated_bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "flushes": self.flushes,
+                "users_flushed": self.users_flushed,
+                "flush_errors": self.flush_errors,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+                "mean_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+            }
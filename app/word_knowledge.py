@@ -0,0 +1,69 @@
+from enum import IntEnum
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+if TYPE_CHECKING:
+    from .models import WordHistory
+
+MASTERED = "mastered"
+NEEDS_REINFORCEMENT = "needs_reinforcement"
+ERROR_MARKERS = ("incorrect", "wrong", "confus", "error", "mistake", "misused")
+
+# Hebrew runs at roughly one token per 2.5 characters with GPT-4o tokenizers
+CHARS_PER_TOKEN = 2.5
+
+def classify_comment(comment: str) -> str:
+    """Mastery implied by one evaluator comment"""
+    comment = comment.lower()
+    if "perfect" in comment and "asked" not in comment:
+        return MASTERED
+    return NEEDS_REINFORCEMENT
+
+def is_error(comment: str) -> bool:
+    comment = comment.lower()
+    return any(marker in comment for marker in ERROR_MARKERS)
+
+class Verdict(IntEnum):
+    """What an evaluator comment says about one use of a word, as stored with compact observations"""
+    OTHER = 0
+    CORRECT = 1
+    INCORRECT = 2
+    ASKED = 3
+
+def verdict(comment: str) -> Verdict:
+    if is_error(comment):
+        return Verdict.INCORRECT
+    if classify_comment(comment) == MASTERED:
+        return Verdict.CORRECT
+    if "asked" in comment.lower():
+        return Verdict.ASKED
+    return Verdict.OTHER
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def digest_line(word: str, history: "WordHistory") -> str:
+    latest = history.observations.comment(-1) if history.observations else ""
+    return f"- {word}: {history.status}, {history.error_count} errors, last: {latest}"
+
+def select_word_knowledge(
+    word_history: Dict[str, "WordHistory"],
+    message_words: Iterable[str],
+    review_words: Iterable[str],
+    top_k: int,
+    max_tokens: int
+) -> List[str]:
+    """
+    Digest lines for the words that matter this turn: the words in the user's
+    message, then the words the review scheduler has due, most overdue first.
+    Nothing else in the history is read, so the cost does not grow with it.
+    Stops at top_k lines or max_tokens estimated tokens.
+    """
+    lines, used = [], 0
+    for word in [w for w in dict.fromkeys([*message_words, *review_words]) if w in word_history][:top_k]:
+        line = digest_line(word, word_history[word])
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return lines
@@ -0,0 +1,61 @@
+"""Prompt tokens of the /assist/ word-identification call: whole frequency list vs matched candidates.
+
+    python -m benchmarks.assist_prompt_tokens [--queries benchmarks/data/sample_queries.txt]
+
+Token counts are exact when tiktoken is installed and estimated otherwise.
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from app.data.data_processing import CandidateMatcher, get_data_list, get_vocabulary
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+except ImportError:
+    tiktoken = None
+
+    def count_tokens(text: str) -> int:
+        # Hebrew averages roughly one token per two UTF-8 bytes with GPT-4o tokenizers
+        return len(text.encode("utf-8")) // 2
+
+DEFAULT_QUERIES = Path(__file__).parent / "data" / "sample_queries.txt"
+
+def word_list_prompt(words) -> str:
+    return f"From this list of Hebrew words: {', '.join(words)}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=Path, default=DEFAULT_QUERIES)
+    args = parser.parse_args()
+
+    queries = [q for q in args.queries.read_text(encoding="utf-8").splitlines() if q.strip()]
+    frequency_list = get_data_list()
+    matcher = CandidateMatcher(get_vocabulary())
+
+    full_tokens = count_tokens(word_list_prompt(frequency_list))
+    matched_tokens, candidate_counts, match_times = [], [], []
+    for query in queries:
+        started = time.perf_counter()
+        candidates = matcher.match(query)
+        match_times.append(time.perf_counter() - started)
+        candidate_counts.append(len(candidates))
+        matched_tokens.append(count_tokens(word_list_prompt(candidates)) if candidates else 0)
+
+    skipped = candidate_counts.count(0)
+    print(f"queries: {len(queries)}  (token counts {'exact' if tiktoken else 'estimated'})")
+    print(f"full list prompt:        {full_tokens} tokens per call")
+    print(f"candidate prompt:        {statistics.mean(matched_tokens):.1f} tokens per call (mean)")
+    print(f"candidates per query:    mean={statistics.mean(candidate_counts):.1f} max={max(candidate_counts)}")
+    print(f"identification skipped:  {skipped} queries with no vocabulary words")
+    print(f"tokens saved:            {len(queries) * full_tokens - sum(matched_tokens)} "
+          f"({100 * (1 - sum(matched_tokens) / (len(queries) * full_tokens)):.1f}%)")
+    print(f"match time:              mean={statistics.mean(match_times) * 1e6:.0f}us max={max(match_times) * 1e6:.0f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Messages/sec when grading a homework transcript: one /converse/ turn per message vs /evaluate/batch/.
+
+The stub charges a fixed delay per model call plus --item-delay per message a
+batch call evaluates, so batching saves the per-call overhead and the reply
+generations, not the per-message output.
+
+    python -m benchmarks.batch_evaluation --messages 200 --delay 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import running_stub_server
+
+SENTENCES = [
+    "אני רוצה ללכת לבית ספר",
+    "הוא היה ילד טוב",
+    "מה אתה רוצה לעשות עכשיו?",
+    "גם אני אוהב מים קרים",
+    "היום יש שמש גדולה בעיר",
+    "אבל לא היה לי זמן",
+    "הבית של המשפחה שלי גדול",
+    "אני הולך עם החברים שלי",
+]
+
+async def per_message(http: httpx.AsyncClient, messages, concurrency: int) -> float:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(message: str):
+        async with slots:
+            response = await http.post("/converse/", json={"username": "batch_per_message", "user_message": message})
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(message) for message in messages))
+    return time.perf_counter() - started
+
+async def batched(http: httpx.AsyncClient, messages):
+    started = time.perf_counter()
+    response = await http.post("/evaluate/batch/", json={"username": "batch_batched", "messages": messages})
+    response.raise_for_status()
+    return time.perf_counter() - started, response.json()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.3, help="stub model latency per call (s)")
+    parser.add_argument("--item-delay", type=float, default=0.02, help="stub latency per message in a batch call (s)")
+    parser.add_argument("--concurrency", type=int, default=4, help="client-side parallelism for per-message turns")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    messages = [rng.choice(SENTENCES) for _ in range(args.messages)]
+
+    with running_stub_server(args.delay, item_delay=args.item_delay) as model_url, \
+            tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir)
+        from app.controller.language_controller import app
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as http:
+                return await per_message(http, messages, args.concurrency), await batched(http, messages)
+
+        single_wall, (batch_wall, result) = asyncio.run(run())
+
+    ok = sum(item["status"] == "ok" for item in result["results"])
+    print(f"messages={args.messages} stub_delay={args.delay:.2f}s item_delay={args.item_delay:.3f}s")
+    print(f"per-message /converse/: {single_wall:6.2f}s  {args.messages / single_wall:7.1f} msg/s  "
+          f"{2 * args.messages} model calls")
+    print(f"/evaluate/batch/:       {batch_wall:6.2f}s  {args.messages / batch_wall:7.1f} msg/s  "
+          f"{result['model_calls']} model calls, {ok}/{args.messages} ok, {result['observations']} observations")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Fire overlapping /converse/ and /assist/ requests for one user and check that no update is lost.
+
+The stub model server answers with random latency so saves land in a
+different order than the requests were made.
+
+    python -m benchmarks.concurrency_stress --converse 40 --assist 40 [--no-cache]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import running_stub_server
+
+USERNAME = "stress_user"
+
+async def fire(app, evaluation_queue, converse: int, assist: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as http:
+        async def post(path, payload):
+            response = await http.post(path, json=payload)
+            response.raise_for_status()
+
+        requests = [post("/converse/", {"username": USERNAME, "user_message": f"הודעה {i}"})
+                    for i in range(converse)]
+        requests += [post("/assist/", {"username": USERNAME, "query": "מה זה אבל?"})
+                     for _ in range(assist)]
+        started = time.perf_counter()
+        await asyncio.gather(*requests)
+        wall = time.perf_counter() - started
+        # /converse/ turns are graded in the background
+        await evaluation_queue.join()
+        return wall
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--converse", type=int, default=40)
+    parser.add_argument("--assist", type=int, default=40)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--no-cache", action="store_true", help="disable the in-process user cache")
+    args = parser.parse_args()
+
+    with running_stub_server(args.delay, args.jitter) as model_url, tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir,
+                          USER_CACHE_ENABLED="false" if args.no_cache else "true")
+        from app.controller.language_controller import EVALUATION_QUEUE, app
+        from app.storage import UserStorage
+
+        wall = asyncio.run(fire(app, EVALUATION_QUEUE, args.converse, args.assist))
+        if UserStorage.cache is not None:
+            UserStorage.cache.flush()
+        progress = UserStorage.store.load(USERNAME)
+
+    # Every stub evaluation records one observation of מה (שלום is not in the vocabulary)
+    expected = {
+        "conversation lines": (2 * args.converse, progress.archived_lines + len(progress.conversation_history)),
+        "observations of מה": (args.converse + args.assist, len(progress.word_history["מה"].observations)),
+        "current_position": (5, progress.current_position),
+    }
+    print(f"{args.converse + args.assist} overlapping requests in {wall:.2f}s")
+    lost = False
+    for name, (want, got) in expected.items():
+        status = "ok" if want == got else "LOST UPDATES"
+        lost |= want != got
+        print(f"{name:<22} expected={want:<5} stored={got:<5} {status}")
+    sys.exit(1 if lost else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""/converse/ response size and serialization time against history length: full word_history vs delta.
+
+Each learner has just finished a turn that added two observations; the
+delta response carries only those, the full one every observation stored.
+
+    python -m benchmarks.delta_responses
+"""
+import gzip
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("USER_DATA_DIR", tempfile.mkdtemp())
+
+from app.controller.language_controller import ConversationResponse, word_history_update
+from app.models import UserProgress
+
+from .synthetic import COMMENTS, SIZES, build_user, vocabulary_words
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+def serialize(progress: UserProgress, since_version):
+    word_history, delta = word_history_update(progress, since_version)
+    return ConversationResponse(
+        response="שלום! מה שלומך היום?",
+        word_history=word_history,
+        next_words_to_learn=[],
+        current_position=progress.current_position,
+        version=progress.version,
+        delta=delta
+    ).model_dump_json().encode("utf-8")
+
+def main():
+    rng = random.Random(0)
+    print(f"{'words':>6} {'obs/word':>9} {'full KB':>9} {'gzip KB':>9} {'full ms':>9} {'gzip ms':>9} "
+          f"{'delta KB':>9} {'delta ms':>9}")
+    for words, observations in SIZES:
+        progress = build_user(words, observations)
+        seen = progress.version
+        for word in rng.sample(vocabulary_words(words), 2):
+            progress.add_observation(word, rng.choice(COMMENTS))
+
+        full, full_time = timed(lambda: serialize(progress, None))
+        compressed, gzip_time = timed(lambda: gzip.compress(full, compresslevel=6))
+        delta, delta_time = timed(lambda: serialize(progress, seen))
+        print(f"{words:>6} {observations:>9} {len(full) / 1024:>9.1f} {len(compressed) / 1024:>9.1f} "
+              f"{full_time * 1000:>9.2f} {gzip_time * 1000:>9.2f} {len(delta) / 1024:>9.2f} {delta_time * 1000:>9.3f}")
+
+if __name__ == "__main__":
+    main()
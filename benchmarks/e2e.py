@@ -0,0 +1,178 @@
+"""End-to-end latency and throughput of the FastAPI app, in-process, against the stub model backend.
+
+Synthetic users with small, medium and very large histories are stored
+before the run. Each endpoint is then driven at several concurrency levels,
+each request going to a different user of the size being measured. p50/p95/p99
+latency and requests/sec per (endpoint, user size, concurrency) are printed
+and written as JSON to --output, for comparing runs across commits.
+
+/assist/ requests pass no_cache so every request pays for its model calls.
+
+    python -m benchmarks.e2e [--latency 0.1 --jitter 0.1] [--concurrency 1 8 32] [--sizes small medium large]
+                             [--endpoints converse assist progress progress_lean] [--output benchmarks/results/e2e.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from .synthetic import MESSAGES, build_user
+
+QUERIES = Path(__file__).parent / "data" / "sample_queries.txt"
+# name: (words, observations per word, hot conversation lines, archived lines)
+USER_SIZES = {
+    "small": (10, 3, 10, 0),
+    "medium": (200, 20, 40, 500),
+    "large": (1000, 100, 40, 20000),
+}
+DEFAULT_OUTPUT = Path(__file__).parent / "results" / "e2e.json"
+
+def synthetic_user(size: str, rng: random.Random):
+    words, observations, lines, archived = USER_SIZES[size]
+    progress = build_user(words, observations, seed=rng.randrange(2**32))
+    progress.conversation_history = [f"{'User' if i % 2 == 0 else 'Assistant'}: {rng.choice(MESSAGES)}"
+                                     for i in range(lines)]
+    progress.archived_lines = archived
+    if archived:
+        progress.conversation_summary = "The learner talked about school, family and the weather in Tel Aviv."
+    return progress
+
+def seed_users(sizes, pool: int, seed: int):
+    """Store `pool` users of each size; returns the usernames by size"""
+    from app.storage import UserStorage
+
+    rng = random.Random(seed)
+    users = {}
+    for size in sizes:
+        progress = synthetic_user(size, rng)
+        users[size] = [f"e2e_{size}_{i}" for i in range(pool)]
+        for username in users[size]:
+            UserStorage.store.save(username, progress)
+    return users
+
+def percentile(ordered, q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+# name: request i for a user, as (method, path, json body)
+ENDPOINTS = {
+    "converse": lambda username, i, queries: (
+        "POST", "/converse/", {"username": username, "user_message": MESSAGES[i % len(MESSAGES)]}),
+    "assist": lambda username, i, queries: (
+        "POST", "/assist/", {"username": username, "query": queries[i % len(queries)], "no_cache": True}),
+    "progress": lambda username, i, queries: ("GET", f"/user/{username}/progress", None),
+    "progress_lean": lambda username, i, queries: ("GET", f"/user/{username}/progress?lean=true", None),
+}
+
+async def run_cell(http: httpx.AsyncClient, endpoint: str, usernames, concurrency: int, requests: int, queries):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        method, path, payload = ENDPOINTS[endpoint](usernames[i % len(usernames)], i, queries)
+        async with slots:
+            started = time.perf_counter()
+            response = await http.request(method, path, json=payload)
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            errors += 1
+        latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "requests_per_second": requests / wall,
+    }
+
+async def run_suite(app, users, endpoints, concurrency_levels, requests: int, queries):
+    """One cell per (endpoint, user size, concurrency); a cell sends at least 2x its concurrency requests"""
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as http:
+        for endpoint in endpoints:
+            for size, usernames in users.items():
+                for concurrency in concurrency_levels:
+                    cell = await run_cell(http, endpoint, usernames, concurrency,
+                                          max(requests, 2 * concurrency), queries)
+                    results.append({"endpoint": endpoint, "user_size": size, "concurrency": concurrency, **cell})
+                    print(f"{endpoint:<14} {size:<7} {concurrency:>4} {cell['p50_ms']:>9.1f} {cell['p95_ms']:>9.1f} "
+                          f"{cell['p99_ms']:>9.1f} {cell['requests_per_second']:>8.1f} {cell['errors']:>6}")
+    return results
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1, help="stub model latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="extra random stub latency, up to this much (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=16, help="requests per cell (at least 2x the concurrency)")
+    parser.add_argument("--pool", type=int, default=8, help="users stored per size")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--sizes", nargs="+", choices=list(USER_SIZES), default=list(USER_SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(MODEL_BACKEND="stub", STUB_LATENCY=str(args.latency), STUB_JITTER=str(args.jitter),
+                          STUB_SEED=str(args.seed), USER_DATA_DIR=data_dir)
+        from app.controller.language_controller import app
+        from app.storage import UserStorage
+
+        started = time.perf_counter()
+        users = seed_users(args.sizes, args.pool, args.seed)
+        print(f"seeded {args.pool} users per size in {time.perf_counter() - started:.1f}s")
+        queries = [line for line in QUERIES.read_text(encoding="utf-8").splitlines() if line]
+
+        print(f"{'endpoint':<14} {'users':<7} {'conc':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>6}")
+        results = asyncio.run(run_suite(app, users, args.endpoints, args.concurrency, args.requests, queries))
+        if UserStorage.cache is not None:
+            UserStorage.cache.flush()
+
+    report = {
+        "benchmark": "e2e",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {
+            "stub_latency": args.latency,
+            "stub_jitter": args.jitter,
+            "requests_per_cell": args.requests,
+            "users_per_size": args.pool,
+            "user_sizes": {size: dict(zip(("words", "observations_per_word", "conversation_lines", "archived_lines"),
+                                          USER_SIZES[size])) for size in args.sizes},
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
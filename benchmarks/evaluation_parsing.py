@@ -0,0 +1,61 @@
+"""Parse rate and parse time of evaluator outputs: legacy line splitting vs parse_evaluation.
+
+Each corpus entry holds a recorded evaluator output and the vocabulary
+words a careful reader would extract from it.
+
+    python -m benchmarks.evaluation_parsing [--corpus benchmarks/data/evaluator_outputs.jsonl]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.data.data_processing import get_vocabulary
+from app.evaluation_parser import parse_evaluation
+
+DEFAULT_CORPUS = Path(__file__).parent / "data" / "evaluator_outputs.jsonl"
+
+def legacy_parse(text, vocabulary):
+    """How both endpoints read evaluations before parse_evaluation"""
+    words = []
+    for line in text.split('\n'):
+        if ':' in line:
+            word, _ = line.split(':', 1)
+            if word.strip() in vocabulary:
+                words.append(word.strip())
+    return words
+
+def timed(fn, corpus, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for entry in corpus:
+            fn(entry["output"])
+    return (time.perf_counter() - started) / (repeat * len(corpus))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    args = parser.parse_args()
+
+    vocabulary = get_vocabulary()
+    corpus = [json.loads(line) for line in args.corpus.read_text(encoding="utf-8").splitlines() if line]
+    expected = sum(len(entry["expected"]) for entry in corpus)
+
+    legacy_found = new_found = unparsed = unmatched = structured = 0
+    for entry in corpus:
+        legacy_found += len(set(legacy_parse(entry["output"], vocabulary)) & set(entry["expected"]))
+        parsed = parse_evaluation(entry["output"], vocabulary)
+        new_found += len({word for word, _ in parsed.observations} & set(entry["expected"]))
+        unparsed += parsed.unparsed
+        unmatched += parsed.unmatched
+        structured += parsed.structured
+
+    print(f"corpus: {len(corpus)} outputs ({structured} JSON), {expected} expected observations")
+    print(f"legacy split:      {legacy_found / expected:.1%} recovered, "
+          f"{timed(lambda text: legacy_parse(text, vocabulary), corpus) * 1e6:.1f} us/output")
+    print(f"parse_evaluation:  {new_found / expected:.1%} recovered, "
+          f"{timed(lambda text: parse_evaluation(text, vocabulary), corpus) * 1e6:.1f} us/output")
+    print(f"reported lost:     {unparsed} unparsed lines, {unmatched} words not in vocabulary")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Concurrent /converse/ load test against the stub model server.
+
+Every /converse/ turn makes two model calls, so with a stub delay of D seconds
+N concurrent users take ~2*D seconds when calls overlap, and ~2*N*D when each
+call stalls the event loop.
+
+    python -m benchmarks.load_test --users 20 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import free_port, running_stub_server, serve_in_thread
+
+async def fire(base_url: str, users: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        async def one(i: int) -> float:
+            started = time.perf_counter()
+            response = await http.post("/converse/", json={
+                "username": f"load_test_user_{i}",
+                "user_message": "שלום, מה שלומך?"
+            })
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(users)))
+        return time.perf_counter() - started, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5, help="stub model latency per call (s)")
+    args = parser.parse_args()
+
+    with running_stub_server(args.delay) as model_url, tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir)
+        from app.controller.language_controller import app
+
+        with serve_in_thread(app, free_port()) as app_url:
+            wall, latencies = asyncio.run(fire(app_url, args.users))
+
+    serial = 2 * args.delay * args.users
+    print(f"users={args.users} stub_delay={args.delay:.2f}s")
+    print(f"wall time:          {wall:.2f}s")
+    print(f"serial lower bound: {serial:.2f}s")
+    print(f"max latency:        {max(latencies):.2f}s")
+    print(f"overlap factor:     {serial / wall:.1f}x")
+    if wall > serial / 2:
+        print("requests did not overlap", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
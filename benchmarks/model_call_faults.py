@@ -0,0 +1,90 @@
+"""Learner-facing failures and waits when the provider answers 429s and latency spikes, with and without retries.
+
+A batch evaluation job and a burst of /converse/ turns share a small number
+of model call slots, so the scheduler's priority decides who waits.
+
+    python -m benchmarks.model_call_faults [--error-rate 0.2 --spike-rate 0.05 --turns 40]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import running_stub_server
+from .synthetic import MESSAGES
+
+async def run_phase(http: httpx.AsyncClient, turns: int, batch_messages: int):
+    async def turn(i: int):
+        started = time.perf_counter()
+        response = await http.post("/converse/", json={"username": f"fault_user_{i}", "user_message": MESSAGES[i % len(MESSAGES)]})
+        return response.status_code, time.perf_counter() - started
+
+    async def batch():
+        response = await http.post("/evaluate/batch/", json={
+            "username": "fault_batch_user",
+            "messages": [MESSAGES[i % len(MESSAGES)] for i in range(batch_messages)]
+        })
+        return sum(result["status"] == "failed" for result in response.json()["results"])
+
+    batch_task = asyncio.ensure_future(batch())
+    await asyncio.sleep(0.05)  # the batch job queues its calls first
+    turns_done = await asyncio.gather(*(turn(i) for i in range(turns)))
+    failed_batch = await batch_task
+    latencies = sorted(elapsed for _, elapsed in turns_done)
+    return {
+        "failed turns": sum(status != 200 for status, _ in turns_done),
+        "failed batch messages": failed_batch,
+        "turn p50 (s)": latencies[len(latencies) // 2],
+        "turn p95 (s)": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--batch-messages", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--spike-rate", type=float, default=0.05)
+    parser.add_argument("--spike-delay", type=float, default=1.5)
+    parser.add_argument("--concurrency", type=int, default=4, help="GPT_MAX_CONCURRENCY for the app")
+    args = parser.parse_args()
+    # Calls failing for good are logged with tracebacks; the counts below say enough
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+
+    with running_stub_server(args.delay, item_delay=0.005, error_rate=args.error_rate, retry_after=args.retry_after,
+                             spike_rate=args.spike_rate, spike_delay=args.spike_delay) as model_url, \
+            tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir,
+                          GPT_MAX_CONCURRENCY=str(args.concurrency), GPT_RETRY_BASE_DELAY="0.1")
+        from app.call_gpt_api import get_scheduler
+        from app.config import Config
+        from app.controller.language_controller import app
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as http:
+                results = {}
+                for retries in (0, Config.GPT_MAX_RETRIES):
+                    Config.GPT_MAX_RETRIES = retries
+                    results[retries] = await run_phase(http, args.turns, args.batch_messages)
+                return results, get_scheduler().stats()
+
+        results, stats = asyncio.run(run())
+
+    print(f"stub: {args.error_rate:.0%} 429s (Retry-After {args.retry_after}s), "
+          f"{args.spike_rate:.0%} spikes of {args.spike_delay}s; {args.concurrency} call slots")
+    print(f"{'':<24}" + "".join(f"{f'retries={retries}':>14}" for retries in results))
+    for name in next(iter(results.values())):
+        print(f"{name:<24}" + "".join(f"{phase[name]:>14.2f}" if isinstance(phase[name], float) else f"{phase[name]:>14}"
+                                      for phase in results.values()))
+    print("scheduler (both phases):")
+    for name, value in stats.items():
+        print(f"  {name:<30} {value:.3f}" if isinstance(value, float) else f"  {name:<30} {value}")
+
+if __name__ == "__main__":
+    main()
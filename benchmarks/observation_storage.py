@@ -0,0 +1,79 @@
+"""Memory per user and store load/save time for users with heavy word histories.
+
+Memory is what a user loaded from its JSON document keeps allocated; the
+stores are timed on a full first save, a one-turn incremental save and a load.
+
+    python -m benchmarks.observation_storage
+"""
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.models import UserProgress
+from app.storage import JSONUserStore, SQLiteUserStore
+
+from .synthetic import COMMENTS, SIZES, build_user, vocabulary_words
+
+def retained_bytes(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    rng = random.Random(0)
+    print(f"{'words':>6} {'obs/word':>9} {'memory MB':>10} {'json KB':>9} {'json save':>10} {'json load':>10} "
+          f"{'db KB':>9} {'db save':>9} {'db +turn':>9} {'db load':>9}   (times in ms)")
+    for words, observations in SIZES:
+        progress = build_user(words, observations)
+        document = json.dumps(progress.model_dump(), ensure_ascii=False)
+        memory = retained_bytes(lambda: UserProgress(**json.loads(document)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            json_store = JSONUserStore(Path(tmp))
+            json_save = timed(lambda: json_store.save("heavy", progress))
+            json_load = timed(lambda: json_store.load("heavy"))
+            json_size = json_store.get_user_file_path("heavy").stat().st_size
+
+            db_path = Path(tmp) / "users.sqlite3"
+            db_store = SQLiteUserStore(db_path)
+            users = iter(range(10))
+            db_save = timed(lambda: db_store.save(f"heavy_{next(users)}", progress))
+            db_store.delete("heavy_1")
+            db_store.delete("heavy_2")
+
+            def one_turn():
+                for word in rng.sample(vocabulary_words(words), 2):
+                    progress.add_observation(word, rng.choice(COMMENTS))
+                db_store.save("heavy_0", progress)
+
+            db_turn = timed(one_turn)
+            db_load = timed(lambda: db_store.load("heavy_0"))
+            db_store._conn.execute("VACUUM")
+            db_store._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db_size = sum(os.path.getsize(path) for path in db_path.parent.glob(f"{db_path.name}*"))
+
+        print(f"{words:>6} {observations:>9} {memory / 2**20:>10.2f} {json_size / 1024:>9.0f} {json_save:>10.1f} "
+              f"{json_load:>10.1f} {db_size / 1024:>9.0f} {db_save:>9.1f} {db_turn:>9.2f} {db_load:>9.1f}")
+
+if __name__ == "__main__":
+    main()
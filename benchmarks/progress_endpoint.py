@@ -0,0 +1,47 @@
+"""Latency and payload size of GET /user/{username}/progress, full vs lean, against word-history size.
+
+Users are served from the in-process user cache, as they are for dashboards
+polling an active learner.
+
+    python -m benchmarks.progress_endpoint
+"""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("USER_DATA_DIR", tempfile.mkdtemp())
+
+from fastapi.testclient import TestClient
+
+from app.controller.language_controller import app
+from app.storage import UserStorage
+
+from .synthetic import SIZES, build_user
+
+def synthetic_user(username: str, words: int, observations: int):
+    progress = build_user(words, observations)
+    progress.conversation_history = [f"User: הודעה {i}" for i in range(40)]
+    UserStorage.save_user_data(username, progress)
+
+def timed(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+def main():
+    client = TestClient(app)
+    print(f"{'words':>6} {'obs/word':>9} {'full ms':>8} {'full KB':>8} {'lean ms':>8} {'lean KB':>8}")
+    for words, observations in SIZES:
+        username = f"bench_{words}_{observations}"
+        synthetic_user(username, words, observations)
+        full, full_time = timed(lambda: client.get(f"/user/{username}/progress"))
+        lean, lean_time = timed(lambda: client.get(f"/user/{username}/progress", params={"lean": True}))
+        print(f"{words:>6} {observations:>9} {full_time * 1000:>8.2f} {len(full.content) / 1024:>8.1f} "
+              f"{lean_time * 1000:>8.2f} {len(lean.content) / 1024:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Conversation prompt size and build time against word-history size: raw observations vs the word digest.
+
+    python -m benchmarks.prompt_build
+"""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("USER_DATA_DIR", tempfile.mkdtemp())
+
+from app.config import Config
+from app.controller.language_controller import PromptTemplate
+from app.review_scheduler import now_seconds
+from app.word_knowledge import estimate_tokens
+
+from .synthetic import SIZES, build_user
+
+def raw_word_knowledge(word_history):
+    """How the prompt described word knowledge before the digest"""
+    word_knowledge = []
+    for word, history in word_history.items():
+        if history.observations:
+            observations = [f"- {obs['timestamp']}: {obs['comment']}"
+                            for obs in sorted(history.observations, key=lambda x: x['timestamp'])]
+            word_knowledge.append(f"{word}:\n" + "\n".join(observations))
+    return "\n".join(word_knowledge)
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+def main():
+    message = "היום הלכתי עם אני לבית ספר"
+    print(f"{'words':>6} {'obs/word':>9} {'raw tokens':>11} {'raw ms':>8} {'digest tokens':>14} {'digest ms':>10}")
+    for words, observations in SIZES:
+        progress = build_user(words, observations)
+        history = progress.word_history
+        raw, raw_time = timed(lambda: raw_word_knowledge(history))
+        prompt, digest_time = timed(lambda: PromptTemplate.create_conversation_prompt(
+            user_message=message, word_history=history, next_words=[],
+            review_words=progress.words_due(now_seconds(), Config.WORDS_PER_TURN), conversation_history=[]
+        ))
+        print(f"{words:>6} {observations:>9} {estimate_tokens(raw):>11} {raw_time * 1000:>8.2f} "
+              f"{estimate_tokens(prompt):>14} {digest_time * 1000:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Prompt-prefix cache hits per call site: the legacy message layout vs the stable-prefix layout.
+
+Simulated learners take interleaved /converse/ turns. Each turn's reply and
+evaluation prompts go through PrefixCache, which counts a prompt prefix already
+seen as cached like the provider does (128-token blocks, 1024 tokens minimum).
+Billed tokens count cached tokens at half price. "stable + padding" appends
+the most common words to the conversation system prompt, to show what lifting
+the prefix past the minimum would cost and save.
+
+    python -m benchmarks.prompt_cache [--users 20 --turns 10 --padding-words 1000]
+"""
+import argparse
+import os
+import random
+import tempfile
+from collections import Counter
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("USER_DATA_DIR", tempfile.mkdtemp())
+
+ROLE_PLAYS = [None, "a waiter in a cafe in Tel Aviv", "a taxi driver"]
+REPLY = "שלום! מה שלומך היום? אני שמח לדבר איתך על הקולנוע."
+
+def legacy_messages(controller, turn, message: str):
+    """How the reply and evaluation prompts were laid out before the stable prefix"""
+    progress = turn.progress
+    role_context = (f"\nYou are {turn.role_play} having a conversation. Maintain character but keep language "
+                    f"appropriate to user's level.") if turn.role_play else ""
+    history = "\n".join(progress.conversation_history[-controller.Config.HISTORY_RECENT_LINES:]) \
+        or "No previous conversation"
+    if progress.conversation_summary:
+        history = f"Summary of earlier conversation: {progress.conversation_summary}\n{history}"
+    knowledge = controller.select_word_knowledge(
+        progress.word_history, controller.CANDIDATE_MATCHER.match(message), turn.review_words,
+        top_k=controller.Config.WORD_KNOWLEDGE_TOP_K, max_tokens=controller.Config.WORD_KNOWLEDGE_MAX_TOKENS
+    )
+    reply = [
+        {"role": "system", "content": controller.CONVERSATION_RULES},
+        {"role": "user", "content": f"Previous Conversation:\n{history}\n\nUser's Message: {message}\n"
+                                    f"Conversation Context:{role_context}\n\nUser's Word Knowledge:\n"
+                                    + "\n".join(knowledge)},
+    ]
+    evaluation = [
+        {"role": "system", "content": "You are a Hebrew language evaluator."},
+        {"role": "user", "content": controller.EVALUATION_INSTRUCTIONS.replace("in their message", "")
+                                    + f"\n\nUser's message: {message}"},
+    ]
+    return reply, evaluation
+
+def stable_messages(controller, turn, message: str, padding: str = ""):
+    input_data = controller.ConversationInput(username="prompt_cache", user_message=message)
+    reply = controller.conversation_messages(input_data, turn)
+    if padding:
+        reply[0] = {"role": "system", "content": reply[0]["content"] + padding}
+    return reply, controller.evaluation_messages(message)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--words", type=int, default=200, help="words each learner has observations for")
+    parser.add_argument("--padding-words", type=int, default=1000, help="common words appended for 'stable + padding'")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.controller import language_controller as controller
+    from app.model_backends import PrefixCache
+    from app.review_scheduler import now_seconds
+    from app.word_knowledge import estimate_tokens
+
+    from .synthetic import MESSAGES, build_user
+
+    padding = ("\n\nMost common Hebrew words, most frequent first:\n"
+               + "\n".join([word for word in controller.VOCABULARY if word][:args.padding_words]))
+    rng = random.Random(args.seed)
+    users = []
+    for i in range(args.users):
+        progress = build_user(args.words, 1, seed=args.seed + i)
+        progress.conversation_summary = "The learner talked about school and family."
+        users.append((progress, ROLE_PLAYS[i % len(ROLE_PLAYS)]))
+
+    layouts = {
+        "legacy": lambda turn, message: legacy_messages(controller, turn, message),
+        "stable": lambda turn, message: stable_messages(controller, turn, message),
+        "stable + padding": lambda turn, message: stable_messages(controller, turn, message, padding),
+    }
+    caches = {layout: PrefixCache() for layout in layouts}
+    totals = {layout: {"reply": Counter(), "evaluation": Counter()} for layout in layouts}
+    prefixes = {}
+    for turn_number in range(args.turns):
+        for progress, role_play in users:
+            message = rng.choice(MESSAGES)
+            review_words = progress.words_due(now_seconds(), controller.Config.WORDS_PER_TURN)
+            turn = controller.Turn(progress, role_play, [], review_words, progress.current_position)
+            for layout, build in layouts.items():
+                for site, messages in zip(("reply", "evaluation"), build(turn, message)):
+                    prompt = sum(estimate_tokens(m["content"]) for m in messages)
+                    cached = min(caches[layout].lookup(messages), prompt)
+                    totals[layout][site].update(calls=1, prompt=prompt, cached=cached)
+                    prefixes[layout, site] = estimate_tokens(messages[0]["content"])
+            progress.conversation_history.extend([f"User: {message}", f"Assistant: {REPLY}"])
+
+    print(f"{args.users} learners x {args.turns} turns, {args.words} words each, "
+          f"{args.padding_words} padding words")
+    print(f"{'layout':<20} {'site':<11} {'system tokens':>13} {'prompt/call':>12} {'cached':>7} {'billed/call':>12}")
+    for layout, sites in totals.items():
+        for site, counts in sites.items():
+            billed = counts["prompt"] - counts["cached"] / 2
+            print(f"{layout:<20} {site:<11} {prefixes[layout, site]:>13} {counts['prompt'] / counts['calls']:>12.0f} "
+                  f"{counts['cached'] / counts['prompt']:>7.1%} {billed / counts['calls']:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Simulated learners under two ways of choosing each turn's words: the old frequency order plus
+reinforcement ranking, and the spaced-repetition review scheduler.
+
+Each learner takes a few turns a day. Every word chosen for a turn is used in
+it. The chance the learner gets a word right decays with time since they last
+used it, exp(-elapsed / stability); stability grows after a success (more so
+after a hard one) and halves after a mistake. Reported per learner, the day
+after the last turn: words met, words known (sum of recall probabilities),
+words recalled with 90%+ probability; and the time to choose a turn's words.
+
+    python -m benchmarks.review_scheduling [--users 1000 --days 30 --turns-per-day 5]
+"""
+import argparse
+import heapq
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.config import Config
+from app.data.data_processing import get_vocabulary
+from app.models import UserProgress
+from app.observations import to_micros
+from app.review_scheduler import DAY
+from app.word_knowledge import NEEDS_REINFORCEMENT
+
+CORRECT = "perfect usage in context"
+INCORRECT = "used word incorrectly, confused with another word"
+ASKED = "asked about meaning, needs reinforcement"
+START = datetime(2024, 1, 1, 18, 0)
+TURN_GAP = timedelta(minutes=15)
+FIRST_STABILITY = DAY  # seconds, after a word is first met: about a third remembered a day later
+
+def reinforcement_words(progress: UserProgress, count: int):
+    """How turns leaned on the history before the scheduler: most errors and most recent needs-reinforcement words"""
+    history = progress.word_history
+    return heapq.nlargest(count, history, key=lambda w: (history[w].status == NEEDS_REINFORCEMENT,
+                                                         history[w].error_count, history[w].last_used or ""))
+
+def choose_ranked(progress: UserProgress, vocabulary, now: int):
+    new = vocabulary.next_unlearned(progress.current_position, progress.word_history, Config.NEW_WORDS_PER_TURN)
+    return reinforcement_words(progress, Config.WORDS_PER_TURN - Config.NEW_WORDS_PER_TURN), new
+
+def choose_scheduled(progress: UserProgress, vocabulary, now: int):
+    reviews = progress.words_due(now, Config.WORDS_PER_TURN)
+    new = vocabulary.next_unlearned(progress.current_position, progress.word_history,
+                                    min(Config.NEW_WORDS_PER_TURN, Config.WORDS_PER_TURN - len(reviews)))
+    return reviews, new
+
+def simulate(choose, args, vocabulary):
+    rng = random.Random(args.seed)
+    retained = met = 0
+    recall_sum = 0.0
+    choose_seconds = 0.0
+    turns = 0
+    end = START + timedelta(days=args.days + 1)
+    for _ in range(args.users):
+        progress = UserProgress()
+        memory = {}  # word: (stability seconds, last used epoch seconds)
+        for day in range(args.days):
+            for turn in range(args.turns_per_day):
+                at = START + timedelta(days=day) + turn * TURN_GAP
+                now = to_micros(at) // 1_000_000
+                started = time.perf_counter()
+                reviews, new = choose(progress, vocabulary, now)
+                choose_seconds += time.perf_counter() - started
+                turns += 1
+                for word in reviews:
+                    stability, last = memory[word]
+                    recall = math.exp(-(now - last) / stability)
+                    if rng.random() < recall:
+                        progress.add_observation(word, CORRECT, at)
+                        memory[word] = (stability * (1.3 + 3 * (1 - recall)), now)
+                    else:
+                        progress.add_observation(word, INCORRECT, at)
+                        memory[word] = (max(stability / 2, FIRST_STABILITY), now)
+                for word in new:
+                    progress.add_observation(word, ASKED, at)
+                    memory[word] = (FIRST_STABILITY, now)
+                if new:
+                    progress.current_position = vocabulary.rank(new[-1]) + 1
+        end_seconds = to_micros(end) // 1_000_000
+        for stability, last in memory.values():
+            recall = math.exp(-(end_seconds - last) / stability)
+            recall_sum += recall
+            retained += recall >= 0.9
+        met += len(memory)
+    return {
+        "met": met / args.users,
+        "known": recall_sum / args.users,
+        "retained": retained / args.users,
+        "choose_us": choose_seconds / turns * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--turns-per-day", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    vocabulary = get_vocabulary()
+
+    print(f"{args.users} learners x {args.days} days x {args.turns_per_day} turns, "
+          f"{Config.WORDS_PER_TURN} words per turn ({Config.NEW_WORDS_PER_TURN} new at most)")
+    print(f"{'policy':<28} {'words met':>10} {'known':>7} {'90% recall':>11} {'choose us':>10}")
+    for name, choose in (("frequency + reinforcement", choose_ranked), ("review scheduler", choose_scheduled)):
+        result = simulate(choose, args, vocabulary)
+        print(f"{name:<28} {result['met']:>10.0f} {result['known']:>7.1f} {result['retained']:>11.1f} "
+              f"{result['choose_us']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Cold start, memory and /converse/ requests/sec of the production server from 1 to N workers.
+
+Cold start is the time from launching the server until /health/ready has
+answered from every worker: for the prefork server (python -m app.server),
+and for `uvicorn --workers N`, which starts every worker as a new interpreter
+that imports the app itself. Memory is summed over the server's processes:
+Pss counts pages shared between them once, split between the sharers;
+private is what each process has to itself. Throughput is measured on the
+prefork server with the in-process stub model (no latency), driven by
+--clients load generator processes, each with --concurrency users in flight.
+
+    python -m benchmarks.server_workers [--workers 1 2 4] [--seconds 10] [--clients 4 --concurrency 8]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set
+
+import httpx
+
+from .stub_model_server import free_port
+
+READY_TIMEOUT = 60.0  # seconds
+
+def server_env(data_dir: str) -> Dict[str, str]:
+    return dict(os.environ, MODEL_BACKEND="stub", STUB_LATENCY="0", USER_DATA_DIR=data_dir,
+                PYTHONPATH=os.getcwd() + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+def launch(kind: str, workers: int, port: int, data_dir: str) -> subprocess.Popen:
+    if kind == "prefork":
+        command = ["-m", "app.server", "--workers", str(workers)]
+    else:
+        command = ["-m", "uvicorn", "app.controller.language_controller:app", "--workers", str(workers)]
+    return subprocess.Popen([sys.executable, *command, "--port", str(port), "--log-level", "warning"],
+                            env=server_env(data_dir))
+
+def wait_ready(url: str, workers: int, started: float):
+    """Seconds until the first worker and until every worker answered /health/ready, and the worker pids"""
+    pids: Set[int] = set()
+    first = None
+    # A new connection per check, so the checks spread over the workers
+    with httpx.Client(base_url=url, timeout=5, limits=httpx.Limits(max_keepalive_connections=0)) as http:
+        while len(pids) < workers:
+            if time.perf_counter() - started > READY_TIMEOUT:
+                raise RuntimeError(f"only {len(pids)} of {workers} workers ready after {READY_TIMEOUT:.0f}s")
+            try:
+                response = http.get("/health/ready")
+                if response.status_code == 200:
+                    pids.add(response.json()["pid"])
+                    first = first or time.perf_counter() - started
+                    continue
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+    return first, time.perf_counter() - started, pids
+
+def memory_kb(pids) -> Dict[str, int]:
+    """Pss and private kB summed over the processes, from /proc/<pid>/smaps_rollup (Linux)"""
+    totals = {"pss": 0, "private": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    name, value = line.split(":", 1)
+                    if name == "Pss":
+                        totals["pss"] += int(value.split()[0])
+                    elif name in ("Private_Clean", "Private_Dirty"):
+                        totals["private"] += int(value.split()[0])
+        except OSError:
+            return {}
+    return totals
+
+def stop(process: subprocess.Popen) -> float:
+    started = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    process.wait(timeout=READY_TIMEOUT)
+    return time.perf_counter() - started
+
+def cold_start(kind: str, workers: int):
+    with tempfile.TemporaryDirectory() as data_dir:
+        port = free_port()
+        started = time.perf_counter()
+        process = launch(kind, workers, port, data_dir)
+        try:
+            first, every, pids = wait_ready(f"http://127.0.0.1:{port}", workers, started)
+            memory = memory_kb(pids | {process.pid})
+        finally:
+            shutdown = stop(process)
+    return first, every, memory, shutdown
+
+async def drive(url: str, client: int, concurrency: int, seconds: float) -> List[float]:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + seconds
+    async with httpx.AsyncClient(base_url=url, timeout=60) as http:
+        async def user(slot: int):
+            turn = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await http.post("/converse/", json={
+                    "username": f"server_workers_{client}_{slot}",
+                    "user_message": f"שלום, מה שלומך? היום אני רוצה ללכת לים {turn}"
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+                turn += 1
+        await asyncio.gather(*(user(slot) for slot in range(concurrency)))
+    return latencies
+
+def client_process(url: str, client: int, concurrency: int, seconds: float, results):
+    results.put(asyncio.run(drive(url, client, concurrency, seconds)))
+
+def throughput(workers: int, args) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as data_dir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        process = launch("prefork", workers, port, data_dir)
+        try:
+            wait_ready(url, workers, time.perf_counter())
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=client_process,
+                                               args=(url, client, args.concurrency, args.seconds, results))
+                       for client in range(args.clients)]
+            started = time.perf_counter()
+            for client in clients:
+                client.start()
+            latencies = sorted(latency for _ in clients for latency in results.get())
+            elapsed = time.perf_counter() - started
+            for client in clients:
+                client.join()
+        finally:
+            stop(process)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10.0, help="load per worker count")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="users in flight per load generator")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'server':<18} {'workers':>7} {'first ready s':>13} {'all ready s':>11} {'pss MB':>8} "
+          f"{'private MB':>10} {'stop s':>7}")
+    for workers in args.workers:
+        for kind in ("prefork", "uvicorn --workers"):
+            first, every, memory, shutdown = cold_start(kind, workers)
+            pss = f"{memory['pss'] / 1024:.0f}" if memory else "-"
+            private = f"{memory['private'] / 1024:.0f}" if memory else "-"
+            print(f"{kind:<18} {workers:>7} {first:>13.2f} {every:>11.2f} {pss:>8} {private:>10} {shutdown:>7.2f}")
+
+    print(f"\n/converse/ on the prefork server, {args.clients} clients x {args.concurrency} users, {args.seconds:.0f}s")
+    print(f"{'workers':>7} {'requests/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = throughput(workers, args)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>10.1f} {result['p50']:>8.1f} {result['p99']:>8.1f} "
+              f"{result['rps'] / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-turn latency of a sitting of turns: POST /converse/ vs one WebSocket session, over a real uvicorn server.
+
+The app runs on the in-process stub backend in a background thread. Each
+learner takes its turns back to back, over keep-alive HTTP or a single
+session socket; the reported time is until the whole reply has arrived.
+
+    python -m benchmarks.session_turns [--learners 8 --turns 20 --latency 0.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import websockets
+
+from .e2e import MESSAGES, percentile
+from .stub_model_server import free_port, serve_in_thread
+
+async def http_learner(base_url: str, username: str, turns: int):
+    latencies = []
+    version = None  # sent back like the session does, so both get word_history deltas
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        for i in range(turns):
+            started = time.perf_counter()
+            response = await http.post("/converse/", json={"username": username, "since_version": version,
+                                                          "user_message": MESSAGES[i % len(MESSAGES)]})
+            response.raise_for_status()
+            version = response.json()["version"]
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def session_learner(base_url: str, username: str, turns: int):
+    latencies = []
+    async with websockets.connect(f"{base_url.replace('http', 'ws', 1)}/converse/session/?username={username}",
+                                  max_size=None) as socket:
+        json.loads(await socket.recv())  # the session event
+        for i in range(turns):
+            started = time.perf_counter()
+            await socket.send(json.dumps({"user_message": MESSAGES[i % len(MESSAGES)]}))
+            while json.loads(await socket.recv())["event"] == "token":
+                pass
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def run(learner, base_url: str, prefix: str, learners: int, turns: int):
+    results = await asyncio.gather(*(learner(base_url, f"{prefix}_{i}", turns) for i in range(learners)))
+    return sorted(latency for latencies in results for latency in latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--learners", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub model latency per call (s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(MODEL_BACKEND="stub", STUB_LATENCY=str(args.latency), USER_DATA_DIR=data_dir)
+        from app.controller.language_controller import app
+
+        with serve_in_thread(app, free_port()) as base_url:
+            print(f"{args.learners} learners x {args.turns} turns, stub latency {args.latency}s")
+            print(f"{'transport':<18} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+            # Fresh learners per transport, so neither inherits the other's history
+            for name, learner in (("POST /converse/", http_learner), ("session", session_learner)):
+                latencies = asyncio.run(run(learner, base_url, name.split()[0].lower(), args.learners, args.turns))
+                print(f"{name:<18} {percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                      f"{sum(latencies) / len(latencies) * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
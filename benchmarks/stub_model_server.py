@@ -0,0 +1,143 @@
+"""OpenAI-compatible chat completions stub with a built-in delay.
+
+Point the app at it with GPT_BASE_URL=http://127.0.0.1:<port>/v1 to load-test
+the controllers without live credentials or spend.
+
+    python -m benchmarks.stub_model_server --port 8100 --delay 1.0
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.stub_responses import BATCH_INDEX, split_tokens, stub_completion
+
+async def stream_chunks(completion_id: str, model: str, content: str, delay: float):
+    """Emit content word by word, spreading the delay evenly across the tokens"""
+    tokens = split_tokens(content)
+    for i, token in enumerate(tokens):
+        await asyncio.sleep(delay / len(tokens))
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": token} if i == 0 else {"content": token},
+                "finish_reason": None
+            }]
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+def create_app(delay: float, jitter: float = 0.0, item_delay: float = 0.0, error_rate: float = 0.0,
+               retry_after: float = 1.0, spike_rate: float = 0.0, spike_delay: float = 0.0) -> FastAPI:
+    """
+    delay is the fixed cost of every completion, jitter adds up to that much at random,
+    and item_delay is added per numbered message in a batch evaluation, standing in
+    for the output tokens a longer answer takes to generate.
+    A fraction error_rate of requests is refused with 429 and Retry-After: retry_after,
+    and a fraction spike_rate takes spike_delay seconds longer.
+    """
+    app = FastAPI()
+    app.state.delay = delay
+    app.state.jitter = jitter
+    app.state.item_delay = item_delay
+    app.state.error_rate = error_rate
+    app.state.retry_after = retry_after
+    app.state.spike_rate = spike_rate
+    app.state.spike_delay = spike_delay
+    app.state.counts = Counter()
+
+    def latency(items: int = 1) -> float:
+        spike = app.state.spike_delay if random.random() < app.state.spike_rate else 0.0
+        return app.state.delay + random.uniform(0, app.state.jitter) + app.state.item_delay * items + spike
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.counts["requests"] += 1
+        if random.random() < app.state.error_rate:
+            app.state.counts["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"Retry-After": f"{app.state.retry_after:g}"}
+            )
+        body = await request.json()
+        messages = body.get("messages") or []
+        json_output = (body.get("response_format") or {}).get("type") == "json_object"
+        content = stub_completion(messages, json_output)
+        batch = BATCH_INDEX.findall(messages[-1]["content"]) if messages else []
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(completion_id, body.get("model", "stub"), content, latency()),
+                media_type="text/event-stream"
+            )
+
+        await asyncio.sleep(latency(max(len(batch), 1)))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    return app
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextlib.contextmanager
+def serve_in_thread(app, port: int):
+    """Run an ASGI app under uvicorn in a background thread for the duration of the block."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+@contextlib.contextmanager
+def running_stub_server(delay: float = 1.0, jitter: float = 0.0, item_delay: float = 0.0, **faults):
+    """Yields the base URL of a stub server; faults are create_app's error and spike settings"""
+    app = create_app(delay, jitter, item_delay, **faults)
+    with serve_in_thread(app, free_port()) as url:
+        yield f"{url}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds to wait before each completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency of up to this many seconds")
+    parser.add_argument("--item-delay", type=float, default=0.0, help="extra seconds per message in a batch evaluation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="fraction of requests with a latency spike")
+    parser.add_argument("--spike-delay", type=float, default=0.0, help="extra seconds per latency spike")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.delay, args.jitter, args.item_delay, args.error_rate, args.retry_after,
+                           args.spike_rate, args.spike_delay), host="127.0.0.1", port=args.port)
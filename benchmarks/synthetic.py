@@ -0,0 +1,34 @@
+"""Synthetic learners and messages shared by the benchmarks, so they all measure the same data."""
+import random
+from typing import List
+
+from app.data.data_processing import get_vocabulary
+from app.models import UserProgress
+
+COMMENTS = [
+    "perfect usage in context",
+    "used word incorrectly, confused with אבל",
+    "correct usage but wrong gender",
+    "asked about meaning, needs reinforcement",
+]
+MESSAGES = [
+    "אני רוצה ללכת לבית ספר",
+    "הוא היה ילד טוב",
+    "מה אתה רוצה לעשות עכשיו?",
+    "היום יש שמש גדולה בעיר",
+]
+SIZES = [(10, 5), (100, 20), (500, 50), (1000, 100)]  # (words, observations per word)
+
+def vocabulary_words(count: int) -> List[str]:
+    """The count most common words"""
+    return [word for word in get_vocabulary() if word][:count]
+
+def build_user(words: int, obs_per_word: int, seed: int = 0) -> UserProgress:
+    """A learner with obs_per_word observations of each of the `words` most common words, made turn by turn"""
+    rng = random.Random(seed)
+    progress = UserProgress(current_position=words)
+    vocabulary = vocabulary_words(words)
+    for _ in range(obs_per_word):
+        for word in vocabulary:
+            progress.add_observation(word, rng.choice(COMMENTS))
+    return progress
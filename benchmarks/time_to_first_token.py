@@ -0,0 +1,60 @@
+"""Time-to-first-token of /converse/stream/ versus the full /converse/ round trip.
+
+    python -m benchmarks.time_to_first_token --turns 10 --delay 1.0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import free_port, running_stub_server, serve_in_thread
+
+PAYLOAD = {"username": "ttft_user", "user_message": "שלום, מה שלומך?"}
+
+async def measure(base_url: str, turns: int):
+    blocking, first_token, stream_total = [], [], []
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        for _ in range(turns):
+            started = time.perf_counter()
+            response = await http.post("/converse/", json=PAYLOAD)
+            response.raise_for_status()
+            blocking.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            ttft = None
+            async with http.stream("POST", "/converse/stream/", json=PAYLOAD) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if ttft is None and line == "event: token":
+                        ttft = time.perf_counter() - started
+                    if line == "event: done":
+                        break
+            first_token.append(ttft)
+            stream_total.append(time.perf_counter() - started)
+    return blocking, first_token, stream_total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=1.0, help="stub model latency per call (s)")
+    args = parser.parse_args()
+
+    with running_stub_server(args.delay) as model_url, tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir)
+        from app.controller.language_controller import app
+
+        # A real server rather than ASGITransport, which buffers the whole response body
+        with serve_in_thread(app, free_port()) as app_url:
+            blocking, first_token, stream_total = asyncio.run(measure(app_url, args.turns))
+
+    print(f"turns={args.turns} stub_delay={args.delay:.2f}s")
+    print(f"/converse/ full response:        {statistics.mean(blocking):.3f}s")
+    print(f"/converse/stream/ first token:   {statistics.mean(first_token):.3f}s")
+    print(f"/converse/stream/ done event:    {statistics.mean(stream_total):.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Cost of tracing: one span, and /converse/ turns against a zero-latency stub, with tracing on and off.
+
+    python -m benchmarks.tracing_overhead [--turns 2000]
+
+Every phase runs on one event loop, inside the app's lifespan, so the
+evaluation queue, user cache flusher and model scheduler start and stop
+the way they do in the server.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from .synthetic import MESSAGES
+
+def span_cost(tracing, repeat: int = 200_000) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with tracing.span("benchmark"):
+            pass
+    return (time.perf_counter() - started) / repeat
+
+async def turns_per_second(app, run: int, turns: int, concurrency: int = 8) -> float:
+    """Each run talks to fresh users, so history grown by earlier runs doesn't slow it down"""
+    slots = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as http:
+        async def turn(i: int):
+            async with slots:
+                response = await http.post("/converse/", json={"username": f"trace_user_{run}_{i % 16}",
+                                                               "user_message": MESSAGES[i % len(MESSAGES)]})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(turn(i) for i in range(turns)))
+        return turns / (time.perf_counter() - started)
+
+async def measure(app, tracing, turns: int):
+    results = {}
+    async with app.router.lifespan_context(app):
+        for run, enabled in enumerate((False, True, False, True)):  # alternate so warm-up favours neither
+            tracing.enabled = enabled
+            results[enabled] = (span_cost(tracing), await turns_per_second(app, run, turns))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(MODEL_BACKEND="stub", USER_DATA_DIR=data_dir)
+        from app import tracing
+        from app.controller.language_controller import app
+
+        results = asyncio.run(measure(app, tracing, args.turns))
+
+    print(f"{'tracing':<9} {'span us':>8} {'turns/s':>9}")
+    for enabled, (cost, rate) in results.items():
+        print(f"{'on' if enabled else 'off':<9} {cost * 1e6:>8.2f} {rate:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Wall-clock latency per /converse/ and /assist/ turn against the stub model server.
+
+Each turn makes two independent model calls; run concurrently a turn costs
+about one stub delay instead of two. Evaluation runs inside the turn and the
+explanation cache is skipped, so every turn makes both calls.
+
+    python -m benchmarks.turn_latency --turns 10 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from .stub_model_server import running_stub_server
+
+ENDPOINTS = {
+    "/converse/": {"username": "latency_user", "user_message": "שלום, מה שלומך?"},
+    "/assist/": {"username": "latency_user", "query": "what does שלום mean?", "no_cache": True},
+}
+
+async def measure(app, turns: int):
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as http:
+        for path, payload in ENDPOINTS.items():
+            latencies = []
+            for _ in range(turns):
+                started = time.perf_counter()
+                response = await http.post(path, json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            results[path] = latencies
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.5, help="stub model latency per call (s)")
+    args = parser.parse_args()
+
+    with running_stub_server(args.delay) as model_url, tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(GPT_BASE_URL=model_url, GPT_API_KEY="stub", USER_DATA_DIR=data_dir,
+                          EVALUATION_IN_BACKGROUND="false")
+        from app.controller.language_controller import app
+        results = asyncio.run(measure(app, args.turns))
+
+    print(f"turns={args.turns} stub_delay={args.delay:.2f}s (sequential calls would take >= {2 * args.delay:.2f}s)")
+    for path, latencies in results.items():
+        print(f"{path:<12} mean={statistics.mean(latencies):.3f}s "
+              f"min={min(latencies):.3f}s max={max(latencies):.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Load latency with and without the user-progress cache, plus hit rate and flush latency under skewed traffic.
+
+Each request yields to the event loop once, as a request handler would, and
+the time spent in cache.put (on the event loop, evictions included) is reported.
+
+    python -m benchmarks.user_cache [--users 500] [--requests 20000]
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.models import UserProgress
+from app.storage import SQLiteUserStore
+from app.user_cache import UserProgressCache
+from .user_store_writes import play_turn
+
+async def replay(cache, store, usernames, first_turn, put_seconds):
+    started = time.perf_counter()
+    for turn, username in enumerate(usernames):
+        progress = cache.get(username)
+        if progress is None:
+            progress = store.load(username)
+            cache.put(username, progress, dirty=False)
+        play_turn(progress, first_turn + turn)
+        put_started = time.perf_counter()
+        cache.put(username, progress, dirty=True)
+        put_seconds.append(time.perf_counter() - put_started)
+        await asyncio.sleep(0)
+        if turn % 500 == 499:
+            await cache.flush_async()
+    await cache.close()
+    return (time.perf_counter() - started) / len(usernames)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--cache-users", type=int, default=100)
+    parser.add_argument("--history-turns", type=int, default=200, help="turns of history per synthetic user")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteUserStore(Path(tmp) / "users.sqlite3")
+        for i in range(args.users):
+            progress = UserProgress()
+            for turn in range(args.history_turns):
+                play_turn(progress, turn)
+            store.save(f"user_{i}", progress)
+
+        started = time.perf_counter()
+        for i in range(200):
+            store.load(f"user_{i % args.users}")
+        uncached = (time.perf_counter() - started) / 200
+
+        cache = UserProgressCache(store, max_users=args.cache_users, max_bytes=1 << 40,
+                                  idle_seconds=3600, flush_interval=3600)
+        # Zipf-like popularity: a few active learners send most of the turns
+        weights = [1 / (rank + 1) for rank in range(args.users)]
+        usernames = [f"user_{i}" for i in rng.choices(range(args.users), weights=weights, k=args.requests)]
+        put_seconds = []
+        per_request = asyncio.run(replay(cache, store, usernames, args.history_turns, put_seconds))
+
+    stats = cache.stats()
+    print(f"store.load (uncached):   {uncached * 1000:.2f} ms")
+    print(f"cached turn (amortized): {per_request * 1000:.2f} ms including misses and flushes")
+    print(f"hit rate:                {stats['hit_rate']:.1%} ({args.cache_users} of {args.users} users resident)")
+    print(f"evictions:               {stats['evictions']}")
+    print(f"flushes:                 {stats['flushes']} ({stats['users_flushed']} user writes for {args.requests} turns)")
+    put_seconds.sort()
+    print(f"put on the event loop:   mean={sum(put_seconds) / len(put_seconds) * 1000:.3f} ms "
+          f"p99={put_seconds[len(put_seconds) * 99 // 100] * 1000:.2f} ms "
+          f"max={put_seconds[-1] * 1000:.1f} ms")
+    print(f"flush latency:           mean={stats['mean_flush_seconds'] * 1000:.1f} ms "
+          f"max={stats['max_flush_seconds'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
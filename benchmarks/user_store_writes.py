@@ -0,0 +1,45 @@
+"""Per-turn save cost of the JSON and SQLite user stores as a user's history grows.
+
+    python -m benchmarks.user_store_writes [--turns 5000]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from app.models import UserProgress
+from app.storage import JSONUserStore, SQLiteUserStore
+
+WORDS = ["כמו", "אני", "שלו", "הוא", "היה", "עבור", "על", "הם", "עם", "בית"]
+
+def play_turn(progress: UserProgress, turn: int):
+    for word in (WORDS[turn % len(WORDS)], WORDS[(turn * 7) % len(WORDS)]):
+        progress.add_observation(word, "perfect usage in context")
+    progress.conversation_history.extend([f"User: הודעה מספר {turn}", f"Assistant: תשובה מספר {turn}"])
+    progress.current_position = turn
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5000)
+    args = parser.parse_args()
+    checkpoints = {10, 100, 1000, 2000, 5000, 10000, args.turns}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {
+            "json": JSONUserStore(Path(tmp)),
+            "sqlite": SQLiteUserStore(Path(tmp) / "users.sqlite3"),
+        }
+        progress = {name: UserProgress() for name in stores}
+        print(f"{'turn':>6} {'json save (ms)':>15} {'sqlite save (ms)':>17}")
+        for turn in range(1, args.turns + 1):
+            timings = {}
+            for name, store in stores.items():
+                play_turn(progress[name], turn)
+                started = time.perf_counter()
+                store.save("bench_user", progress[name])
+                timings[name] = (time.perf_counter() - started) * 1000
+            if turn in checkpoints:
+                print(f"{turn:>6} {timings['json']:>15.2f} {timings['sqlite']:>17.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Microbenchmarks for Vocabulary against plain-list lookups at several vocabulary sizes.
+
+    python -m benchmarks.vocabulary_lookup [--sizes 1000 10000 50000]
+"""
+import argparse
+import random
+import timeit
+
+from app.data.data_processing import Vocabulary
+
+HEBREW_LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+
+def synthetic_words(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(HEBREW_LETTERS) for _ in range(rng.randint(2, 7))))
+    return list(words)
+
+def per_call_us(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'size':>6} {'operation':<26} {'list (us)':>12} {'Vocabulary (us)':>16}")
+    for size in args.sizes:
+        words = synthetic_words(size, rng)
+        vocabulary = Vocabulary(words)
+        probes = rng.sample(words, 100) + ["לא-קיים"] * 10
+        # A learner halfway through the list who knows everything before their position
+        position = size // 2
+        known = {w: None for w in words[:position]}
+
+        rows = [
+            ("membership (110 probes)",
+             lambda: [w in words for w in probes],
+             lambda: [w in vocabulary for w in probes]),
+            ("rank (100 probes)",
+             lambda: [words.index(w) for w in probes[:100]],
+             lambda: [vocabulary.rank(w) for w in probes[:100]]),
+            ("next 5 unlearned",
+             lambda: [w for w in words[position:] if w not in known][:5],
+             lambda: vocabulary.next_unlearned(position, known, 5)),
+        ]
+        for name, baseline, indexed in rows:
+            number = 20 if size >= 10000 else 200
+            print(f"{size:>6} {name:<26} {per_call_us(baseline, number):>12.1f} {per_call_us(indexed, number):>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Import the per-user JSON files in user_data/ into the SQLite user store.
+
+    python3 migrate_user_data.py [--data-dir user_data] [--db user_data/users.sqlite3] [--force]
+
+Users already in the database are skipped unless --force is given. Each import
+is read back and compared with the JSON file; the JSON files are left in place.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.config import Config
+from app.storage import JSONUserStore, SQLiteUserStore
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", type=Path, default=Path(Config.USER_DATA_DIR))
+    parser.add_argument("--db", type=Path, default=Path(Config.USER_DB_PATH))
+    parser.add_argument("--force", action="store_true", help="re-import users already in the database")
+    args = parser.parse_args()
+
+    source = JSONUserStore(args.data_dir)
+    target = SQLiteUserStore(args.db)
+    migrated = skipped = failed = 0
+
+    for file_path in sorted(args.data_dir.glob("*.json")):
+        username = file_path.stem
+        if target.exists(username) and not args.force:
+            skipped += 1
+            continue
+        try:
+            progress = source.load(username)
+            if args.force:
+                target.delete(username)
+            target.save(username, progress)
+            if target.load(username) != progress:
+                raise ValueError("read-back does not match the JSON file")
+        except Exception as e:
+            print(f"FAILED {username}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        migrated += 1
+
+    print(f"migrated={migrated} skipped={skipped} failed={failed} -> {args.db}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
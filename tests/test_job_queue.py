@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from app.job_queue import UserJobQueue
+
+def make_queue(tmp_path, handler, workers=2):
+    return UserJobQueue(tmp_path / "jobs.sqlite3", handler, workers=workers, max_attempts=3, retry_delay=0.1)
+
+def test_stop_is_bounded_when_a_job_ignores_cancellation(tmp_path):
+    async def stubborn(username, payload):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await asyncio.sleep(10)
+
+    async def scenario():
+        queue = make_queue(tmp_path, stubborn)
+        queue.start()
+        queue.submit("u", {"n": 1})
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await queue.stop(timeout=0.2)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 1
+
+def test_jobs_left_at_stop_run_after_the_next_start(tmp_path):
+    done = []
+
+    async def handler(username, payload):
+        done.append(payload["n"])
+
+    async def scenario():
+        queue = make_queue(tmp_path, handler)
+        queue.start()
+        await queue.stop()
+        queue.submit("u", {"n": 1})  # stays stored while stopped
+        await asyncio.sleep(0.05)
+        assert done == []
+        queue.start()
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert done == [1]
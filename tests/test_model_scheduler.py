@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+import pytest
+
+from app.model_scheduler import INTERACTIVE, ModelCallScheduler
+
+def test_cancel_in_the_same_iteration_as_the_grant_propagates_and_frees_the_slot():
+    async def scenario():
+        scheduler = ModelCallScheduler(max_concurrency=1)
+        await scheduler.acquire(INTERACTIVE, tokens=1, deadline=time.monotonic() + 10)
+        waiter = asyncio.create_task(scheduler.acquire(INTERACTIVE, tokens=1, deadline=time.monotonic() + 10))
+        await asyncio.sleep(0)  # the waiter is queued
+        # Grant the slot and cancel the waiter before it gets to run
+        scheduler.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
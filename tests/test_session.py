@@ -0,0 +1,56 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("STUB_LATENCY", "1.0")  # a streamed reply takes about a second
+os.environ.setdefault("USER_DATA_DIR", tempfile.mkdtemp())
+
+import uvicorn
+import websockets
+
+from app.controller.language_controller import OPEN_SESSIONS, SESSION_STATS, app
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_client_closing_while_a_reply_streams_ends_the_session_quietly(caplog):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    async def leave_mid_reply():
+        async with websockets.connect(f"ws://127.0.0.1:{port}/converse/session/?username=leaver") as ws:
+            assert json.loads(await ws.recv())["event"] == "session"
+            await ws.send(json.dumps({"user_message": "שלום, מה שלומך היום?"}))
+            assert json.loads(await ws.recv())["event"] == "token"
+        # Closed: the server's next token send finds the client gone
+
+    # uvicorn's loggers don't propagate to the root logger caplog listens on
+    server_logger = logging.getLogger("uvicorn.error")
+    server_logger.addHandler(caplog.handler)
+    try:
+        with caplog.at_level(logging.ERROR):
+            asyncio.run(leave_mid_reply())
+            deadline = time.monotonic() + 5
+            while OPEN_SESSIONS and time.monotonic() < deadline:
+                time.sleep(0.05)
+            time.sleep(1.5)  # the rest of the reply's tokens
+    finally:
+        server_logger.removeHandler(caplog.handler)
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    assert not OPEN_SESSIONS
+    assert SESSION_STATS["opened"] == 1
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from app.models import UserProgress
+from app.user_cache import UserProgressCache
+
+class RecordingStore:
+    def __init__(self):
+        self.saved = []
+
+    def save(self, username, progress):
+        self.saved.append(username)
+
+def make_cache(store, **overrides):
+    settings = dict(max_users=100, max_bytes=10**9, idle_seconds=600, flush_interval=60)
+    settings.update(overrides)
+    return UserProgressCache(store, **settings)
+
+def test_writes_after_close_go_straight_to_the_store():
+    store = RecordingStore()
+
+    async def scenario():
+        cache = make_cache(store)
+        cache.put("before", UserProgress())
+        await cache.close()
+        cache.put("after", UserProgress())
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert store.saved == ["before", "after"]
+    assert cache._flusher is None
+
+def test_dirty_users_are_written_off_the_event_loop_before_eviction():
+    store = RecordingStore()
+    save_threads = []
+    original_save = store.save
+
+    def save(username, progress):
+        save_threads.append(threading.get_ident())
+        original_save(username, progress)
+
+    store.save = save
+
+    async def scenario():
+        cache = make_cache(store, max_users=1)
+        cache.put("first", UserProgress())
+        cache.put("second", UserProgress())
+        # Still readable while its write is pending
+        assert "first" in cache._entries
+        assert store.saved == []
+        for _ in range(100):
+            if "first" not in cache._entries:
+                break
+            await asyncio.sleep(0.01)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert store.saved == ["first"]
+    assert threading.get_ident() not in save_threads
+    assert list(cache._entries) == ["second"]
+    assert cache.evictions == 1